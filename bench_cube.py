@@ -0,0 +1,310 @@
+"""
+Microbenchmarks of the cube hot paths: the manim RubiksCube of the scenes,
+the batched engines (cube_engine, cube_coords), compiled move sequences,
+key packing, index lookups, canonical keys and scramble parsing.
+
+Every benchmark has a fixed seed and batch size and reports items (states,
+sequences or lines) per second, the median of several rounds, and its
+spread: the interquartile range of the rounds relative to the median. The
+results are written as JSON and compared against a baseline, by default
+the committed bench_baseline.json, so that a slowdown shows up as a ratio:
+
+    python bench_cube.py --output bench_results.json
+    python bench_cube.py --only engine_expand keys_pack
+    python bench_cube.py --output bench_baseline.json --no-compare
+
+The RubiksCube benchmarks need manim_rubikscube and are skipped without it,
+and the results list them under "skipped". The committed baseline was
+recorded without it, so cube_do_move and cube_indices_hash have no baseline
+yet: record them where the manim_rubikscube fork is installed, with the
+last command above.
+
+A benchmark is flagged SLOWER if its ratio is below 1 by more than
+--tolerance plus the spreads of both the run and the baseline, so that
+noisy benchmarks need a bigger slowdown. Even then, timings on shared
+machines vary, so the exit status is only 1 with --fail-on-slowdown, and
+only if the baseline was recorded on the same machine (MACHINE_KEYS), as
+rates from other hardware say nothing about the code.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+import cube_coords
+import cube_engine
+import cube_index
+import cube_ingest
+import cube_keys
+import cube_sampling
+import cube_sequences
+import cube_symmetry
+
+try:
+    from manim_rubikscube import RubiksCube
+except ImportError:
+    RubiksCube = None
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_baseline.json")
+SEED = 0
+BATCH_SIZE = 1 << 14
+# Moves per call of the RubiksCube benchmarks, which turn one cube at a time.
+CUBE_MOVES = 100
+SEQUENCE_LENGTH = 20
+INDEX_RADIUS = 5
+# What must match between the results and the baseline for a slowdown to fail.
+MACHINE_KEYS = ["system", "machine", "cpu", "cpu_count", "python", "numpy"]
+
+
+def _random_moves(rng, n):
+    return [cube_engine.MOVE_NAMES[m] for m in rng.integers(0, 18, n)]
+
+
+def _states(rng, n=BATCH_SIZE):
+    return cube_sampling.uniform_states(n, rng)
+
+
+# Every benchmark takes a seeded generator (and those in NEEDS_WORK_DIR a
+# directory for files that must exist while it runs) and returns (run,
+# items, unit): a function to time and how many items one call of it
+# processes.
+
+
+def bench_cube_do_move(rng):
+    cube = RubiksCube()
+    moves = _random_moves(rng, CUBE_MOVES)
+
+    def run():
+        for move in moves:
+            cube.do_move(move)
+
+    return run, len(moves), "moves"
+
+
+def bench_cube_indices_hash(rng):
+    cube = RubiksCube()
+    moves = _random_moves(rng, CUBE_MOVES)
+
+    def run():
+        for move in moves:
+            cube.update_indices_after_move(move)
+            cube.hash()
+
+    return run, len(moves), "moves"
+
+
+def bench_engine_apply_move(rng):
+    states = _states(rng)
+    return lambda: cube_engine.apply_move(states, 7), len(states), "states"
+
+
+def bench_engine_expand(rng):
+    # A whole batch, like the chunks of the searches: a small one fits in
+    # the cache and is several times faster than real use.
+    states = _states(rng)
+    return lambda: cube_engine.expand(states), 18 * len(states), "states"
+
+
+def bench_coords_expand(rng):
+    coords = cube_coords.from_stickers(_states(rng))
+    cube_coords.move_tables()
+    return lambda: cube_coords.expand(coords), 18 * len(coords), "states"
+
+
+def bench_sequence_compile(rng):
+    # Uncached, so every call composes all the sequences from scratch.
+    keys = [" ".join(_random_moves(rng, SEQUENCE_LENGTH)) for _ in range(1000)]
+
+    def run():
+        for key in keys:
+            cube_sequences.CompiledSequence(key)
+
+    return run, len(keys), "sequences"
+
+
+def bench_sequence_apply(rng):
+    compiled = cube_sequences.compile_sequence(_random_moves(rng, SEQUENCE_LENGTH))
+    states = _states(rng)
+    return lambda: compiled.apply(states), len(states), "states"
+
+
+def bench_keys_pack(rng):
+    states = _states(rng)
+    return lambda: cube_keys.pack(states), len(states), "states"
+
+
+def bench_keys_unpack(rng):
+    keys = cube_keys.pack(_states(rng))
+    return lambda: cube_keys.unpack(keys), len(keys), "states"
+
+
+def bench_index_lookup(rng, work_dir):
+    # Half of the queries are in the index, half are random states.
+    path = os.path.join(work_dir, f"index_{INDEX_RADIUS}.bin")
+    cube_index.build_index(path, INDEX_RADIUS)
+    index = cube_index.StateIndex(path)
+    inside = np.asarray(index.keys[rng.integers(0, len(index), BATCH_SIZE // 2)])
+    keys = np.concatenate([inside, cube_keys.pack(_states(rng, BATCH_SIZE // 2))])
+    return lambda: index.depth_of_keys(keys), len(keys), "states"
+
+
+def bench_canonical_keys(rng):
+    states = _states(rng, BATCH_SIZE // 4)
+    return lambda: cube_symmetry.canonical_keys(states), len(states), "states"
+
+
+def bench_ingest_moves(rng):
+    lines = [" ".join(_random_moves(rng, SEQUENCE_LENGTH)) for _ in range(BATCH_SIZE // 4)]
+    return lambda: cube_ingest.compile_moves(lines), len(lines), "lines"
+
+
+BENCHMARKS = {
+    "cube_do_move": bench_cube_do_move,
+    "cube_indices_hash": bench_cube_indices_hash,
+    "engine_apply_move": bench_engine_apply_move,
+    "engine_expand": bench_engine_expand,
+    "coords_expand": bench_coords_expand,
+    "sequence_compile": bench_sequence_compile,
+    "sequence_apply": bench_sequence_apply,
+    "keys_pack": bench_keys_pack,
+    "keys_unpack": bench_keys_unpack,
+    "index_lookup": bench_index_lookup,
+    "canonical_keys": bench_canonical_keys,
+    "ingest_moves": bench_ingest_moves,
+}
+NEEDS_MANIM = {"cube_do_move", "cube_indices_hash"}
+NEEDS_WORK_DIR = {"index_lookup"}
+
+
+def _cpu():
+    try:
+        with open("/proc/cpuinfo") as f:
+            for line in f:
+                if line.startswith("model name"):
+                    return line.split(":", 1)[1].strip()
+    except OSError:
+        pass
+    return platform.processor()
+
+
+def machine_info():
+    """The machine and versions the benchmarks run on, see MACHINE_KEYS."""
+    return {
+        "system": platform.system(),
+        "machine": platform.machine(),
+        "cpu": _cpu(),
+        "cpu_count": os.cpu_count(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+    }
+
+
+def measure(run, items, repeat=9, min_time=0.2):
+    """
+    The median rate of `repeat` rounds of calls, each round at least
+    min_time long, and the spread of the rates (see the module docstring).
+    """
+    run()
+    rates = []
+    for _ in range(repeat):
+        calls = 0
+        start_time = time.perf_counter()
+        while True:
+            run()
+            calls += 1
+            elapsed = time.perf_counter() - start_time
+            if elapsed >= min_time:
+                break
+        rates.append(calls * items / elapsed)
+    q1, median, q3 = np.percentile(rates, [25, 50, 75])
+    return median, (q3 - q1) / median
+
+
+def run_benchmarks(names=None, repeat=9, min_time=0.2):
+    """Run the benchmarks (all by default) and return them as a JSON-able dict."""
+    results = {}
+    skipped = []
+    # The files stay until all benchmarks are done, memory-mapped files
+    # cannot be deleted on Windows.
+    with tempfile.TemporaryDirectory() as work_dir:
+        for name in names or BENCHMARKS:
+            if name in NEEDS_MANIM and RubiksCube is None:
+                print(f"{name:20s} skipped, no manim_rubikscube")
+                skipped.append(name)
+                continue
+            args = (work_dir,) if name in NEEDS_WORK_DIR else ()
+            run, items, unit = BENCHMARKS[name](np.random.default_rng(SEED), *args)
+            rate, spread = measure(run, items, repeat, min_time)
+            results[name] = {"rate": rate, "spread": spread, "unit": f"{unit}/s"}
+            print(f"{name:20s} {rate:>16,.0f} {unit}/s  \u00b1{100 * spread:4.1f} %")
+            # Drops the mappings of the benchmark before the files go.
+            run = None
+    return {
+        **machine_info(),
+        "batch_size": BATCH_SIZE,
+        "seed": SEED,
+        "results": results,
+        "skipped": skipped,
+    }
+
+
+def compare(results, baseline, tolerance=0.2):
+    """
+    Print the ratio of every rate to the baseline and return the names of
+    the benchmarks that are more than `tolerance` plus the spreads of both
+    slower.
+    """
+    slower = []
+    for name, result in results["results"].items():
+        if name not in baseline["results"]:
+            print(f"{name:20s} no baseline")
+            continue
+        base = baseline["results"][name]
+        ratio = result["rate"] / base["rate"]
+        allowed = tolerance + result.get("spread", 0.0) + base.get("spread", 0.0)
+        flag = ""
+        if ratio < 1 - allowed:
+            slower.append(name)
+            flag = "  SLOWER"
+        print(f"{name:20s} {ratio:6.2f}x baseline, allowed {1 - allowed:4.2f}x{flag}")
+    return slower
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the cube hot paths.")
+    parser.add_argument("--only", nargs="+", choices=list(BENCHMARKS), help="run only these")
+    parser.add_argument("--output", help="write the results as JSON here")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--no-compare", action="store_true", help="do not compare with the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown, 0.2 = 20 %%")
+    parser.add_argument(
+        "--fail-on-slowdown",
+        action="store_true",
+        help="exit with status 1 if a benchmark is slower than its baseline",
+    )
+    parser.add_argument("--repeat", type=int, default=9)
+    parser.add_argument("--min-time", type=float, default=0.2, help="seconds per repeat")
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.only, args.repeat, args.min_time)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
+
+    if not args.no_compare and os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        print()
+        slower = compare(results, baseline, args.tolerance)
+        different = [key for key in MACHINE_KEYS if results.get(key) != baseline.get(key)]
+        if slower and args.fail_on_slowdown:
+            if different:
+                print(f"not failing, the baseline is from another machine (different {', '.join(different)})")
+            else:
+                sys.exit(1)
@@ -0,0 +1,200 @@
+"""
+The graph of all states within `radius` moves of a state, as NumPy arrays,
+for the graph scenes (Neighborhood in cube_properties) and their layouts.
+
+Nodes are numbered layer by layer in the order a BFS discovers them: by
+the node of their parent and then the move from it (see
+cube_engine.MOVE_NAMES), so node 0 is the start and nodes 1..18 its
+neighbours. The edges are in CSR form: the neighbours of node v are
+indices[indptr[v]:indptr[v + 1]], reached by the moves
+edge_moves[indptr[v]:indptr[v + 1]]. Every edge is there in both directions
+and edges leading out of the ball are left out.
+
+Each layer is expanded with one batch of cube_engine.expand and deduplicated
+on packed keys (cube_keys), and the edges with one lookup of all successors
+in the sorted keys, so radius 3 (3,502 nodes) takes milliseconds.
+
+load_ball() keeps the graphs it builds in CACHE_DIR as .npz files named by
+the key of the start state and the radius, so a scene loads them in
+milliseconds. A file saved with another cube_engine.VERSION is rebuilt.
+
+    python cube_ball.py 3 --cache-dir ball_cache
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+
+import cube_engine
+import cube_keys
+
+# Default directory of load_ball(), relative to where the scenes are rendered.
+CACHE_DIR = "ball_cache"
+
+# The arrays of a BallGraph saved in a cache file.
+_ARRAYS = ["states", "layer", "parent", "parent_move", "indptr", "indices", "edge_moves"]
+
+# Number of nodes whose successors are looked up at once when collecting
+# the edges, each takes 18 * (48 + 16) bytes.
+CHUNK_SIZE = 1 << 16
+
+
+class BallGraph:
+    """
+    The states within `radius` moves of `start`, N x 48, and for every node
+    its layer (distance from start), parent node and the move from the
+    parent (-1 for the start), plus the edges as CSR arrays.
+    """
+
+    def __init__(self, states, layer, parent, parent_move, indptr, indices, edge_moves):
+        self.states = states
+        self.layer = layer
+        self.parent = parent
+        self.parent_move = parent_move
+        self.indptr = indptr
+        self.indices = indices
+        self.edge_moves = edge_moves
+        self.radius = int(layer[-1])
+        self.keys = cube_keys.pack(states)
+        self._order = np.argsort(cube_keys.as_void(self.keys))
+
+    def __len__(self):
+        return len(self.states)
+
+    def layer_sizes(self):
+        return np.bincount(self.layer, minlength=self.radius + 1)
+
+    def layers(self):
+        """The nodes of every layer, as ranges of node numbers."""
+        bounds = np.concatenate([[0], np.cumsum(self.layer_sizes())])
+        return [range(bounds[d], bounds[d + 1]) for d in range(self.radius + 1)]
+
+    def neighbors(self, node):
+        """The neighbours of a node and the moves that lead to them."""
+        edges = slice(self.indptr[node], self.indptr[node + 1])
+        return self.indices[edges], self.edge_moves[edges]
+
+    def edge_list(self):
+        """The undirected edges as an E x 2 array of node pairs (u, v), u < v."""
+        sources = np.repeat(np.arange(len(self), dtype=self.indices.dtype), np.diff(self.indptr))
+        pairs = np.stack([sources, self.indices], axis=1)
+        return np.unique(pairs[pairs[:, 0] < pairs[:, 1]], axis=0)
+
+    def node_of(self, states):
+        """The node of every state, -1 for states outside the ball."""
+        pos = cube_keys.search(self.keys[self._order], cube_keys.pack(states))
+        return np.where(pos >= 0, self._order[np.maximum(pos, 0)], -1)
+
+    def path_to(self, node):
+        """Move indices that take the start to the state of a node."""
+        moves = []
+        while self.parent[node] >= 0:
+            moves.append(int(self.parent_move[node]))
+            node = self.parent[node]
+        return moves[::-1]
+
+
+def _edges(states, keys, chunk_size=CHUNK_SIZE):
+    # CSR arrays of the edges between the given states, by looking up all
+    # their successors among them.
+    order = np.argsort(cube_keys.as_void(keys))
+    table = keys[order]
+    indices = []
+    edge_moves = []
+    counts = np.empty(len(states), dtype=np.int64)
+
+    for start in range(0, len(states), chunk_size):
+        pos = cube_keys.search(table, cube_keys.pack(cube_engine.expand(states[start:start + chunk_size])))
+        found = pos.reshape(-1, 18) >= 0
+        counts[start:start + len(found)] = found.sum(axis=1)
+        indices.append(order[pos[found.ravel()]].astype(np.int32))
+        edge_moves.append(np.nonzero(found)[1].astype(np.int8))
+
+    indptr = np.concatenate([[0], np.cumsum(counts)])
+    return indptr, np.concatenate(indices), np.concatenate(edge_moves)
+
+
+def build_ball(radius, start=cube_engine.SOLVED, chunk_size=CHUNK_SIZE):
+    """The BallGraph of all states within `radius` moves of `start`."""
+    start = np.asarray(start, dtype=np.uint8).reshape(1, 48)
+    states = [start]
+    parents = [np.full(1, -1, dtype=np.int32)]
+    parent_moves = [np.full(1, -1, dtype=np.int8)]
+    # Sorted keys of the last two layers, the only ones a successor can be in.
+    level = cube_keys.pack(start)
+    previous = np.empty(0, dtype=cube_keys.KEY_DTYPE)
+    first = 0
+
+    for _ in range(radius):
+        succ = cube_engine.expand(states[-1]).reshape(-1, 48)
+        keys = cube_keys.pack(succ)
+        new = ~cube_keys.contains(level, keys) & ~cube_keys.contains(previous, keys)
+        # The first time a BFS sees every new state, in the order it does.
+        _, seen = cube_keys.unique(keys[new], return_index=True)
+        found = np.flatnonzero(new)[np.sort(seen)]
+
+        states.append(succ[found])
+        parents.append((first + found // 18).astype(np.int32))
+        parent_moves.append((found % 18).astype(np.int8))
+        first += len(states[-2])
+        level, previous = cube_keys.sort(keys[found]), level
+
+    layer = np.repeat(np.arange(radius + 1, dtype=np.int8), [len(s) for s in states])
+    states = np.concatenate(states)
+    indptr, indices, edge_moves = _edges(states, cube_keys.pack(states), chunk_size)
+    return BallGraph(
+        states, layer, np.concatenate(parents), np.concatenate(parent_moves), indptr, indices, edge_moves
+    )
+
+
+def cache_path(radius, start=cube_engine.SOLVED, cache_dir=CACHE_DIR):
+    key = cube_keys.pack(start)[0]
+    return os.path.join(cache_dir, f"ball_{key['hi']:016x}{key['lo']:016x}_{radius}.npz")
+
+
+def save_ball(path, graph):
+    """Save a BallGraph as an .npz file tagged with cube_engine.VERSION."""
+    with open(path + ".tmp", "wb") as f:
+        np.savez(f, version=cube_engine.VERSION, **{name: getattr(graph, name) for name in _ARRAYS})
+    os.replace(path + ".tmp", path)
+
+
+def open_ball(path):
+    """The BallGraph saved in a file, None if it was saved by another engine version."""
+    with np.load(path) as data:
+        if int(data["version"]) != cube_engine.VERSION:
+            return None
+        return BallGraph(*[data[name] for name in _ARRAYS])
+
+
+def load_ball(radius, start=cube_engine.SOLVED, cache_dir=CACHE_DIR):
+    """
+    The BallGraph of all states within `radius` moves of `start`, from the
+    cache if it is there and up to date, otherwise built and saved to it.
+    """
+    path = cache_path(radius, start, cache_dir)
+    graph = open_ball(path) if os.path.exists(path) else None
+    if graph is None:
+        graph = build_ball(radius, start)
+        os.makedirs(cache_dir, exist_ok=True)
+        save_ball(path, graph)
+    return graph
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the graph of the states near solved.")
+    parser.add_argument("radius", type=int)
+    parser.add_argument("--cache-dir", help="load the graph from here, or build and save it")
+    args = parser.parse_args()
+
+    start_time = time.time()
+    if args.cache_dir:
+        graph = load_ball(args.radius, cache_dir=args.cache_dir)
+    else:
+        graph = build_ball(args.radius)
+    elapsed = time.time() - start_time
+    print(f"radius {graph.radius}: {len(graph):,d} nodes, {len(graph.indices):,d} directed edges")
+    print(f"done in {1000 * elapsed:.1f} ms")
+    for depth, size in enumerate(graph.layer_sizes()):
+        print(f"layer {depth:2d}: {size:>10,d}")
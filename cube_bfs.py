@@ -0,0 +1,512 @@
+"""
+Breadth-first search over the cube graph, one whole depth at a time.
+
+Every level is kept as a sorted array of packed keys (see cube_keys). The
+next level is the set of successors of the current one minus the current
+and the previous level, which is all the deduplication we need: a neighbor
+of a state at distance d is at distance d - 1, d or d + 1.
+
+Counting the states at distance <= 7 from solved needs about 8 GB:
+
+    python cube_bfs.py 7 --output depth_counts.json
+
+With --processes, every level is split between worker processes by a hash
+of the keys, each worker expanding and deduplicating its own shard. With
+--work-dir, the levels are kept on disk and only a fixed-size buffer of keys
+is in memory, which is what depths 8 and more need.
+
+With --symmetric, a level only keeps one state of every class of states
+that are symmetric to each other or inverses (see cube_symmetry), which
+takes up to 96 times less memory. The class of a state has the same
+distance from solved, and the classes of the neighbours of all its states
+are those of the neighbours of the representative and of its inverse, so
+these are what gets expanded. The counts are still of all states.
+
+With --telemetry, every level writes JSON lines of its progress (see
+cube_telemetry), --progress shows it with tqdm.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import time
+import traceback
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+import cube_engine
+import cube_keys
+import cube_symmetry
+import cube_telemetry
+
+# Number of states expanded at once, each takes 18 * (48 + 16) bytes.
+CHUNK_SIZE = 1 << 18
+
+
+def expand_keys(keys, symmetric=False):
+    """
+    Packed keys of all 18 successors of the given packed keys, or with
+    symmetric, the canonical keys of the 36 successors of the states and
+    their inverses.
+    """
+    states = cube_keys.unpack(keys)
+    if not symmetric:
+        return cube_keys.pack(cube_engine.expand(states))
+    states = np.concatenate([states, cube_symmetry.inverse(states)])
+    return cube_symmetry.canonical_keys(cube_engine.expand(states))
+
+
+def level_size(keys, symmetric=False, chunk_size=1 << 14):
+    """The number of states of a level, all the states of every class with symmetric."""
+    if not symmetric:
+        return len(keys)
+    return sum(
+        int(cube_symmetry.class_sizes(np.asarray(keys[start:start + chunk_size])).sum())
+        for start in range(0, len(keys), chunk_size)
+    )
+
+
+def _start_key(start, symmetric):
+    # Distances are only the same within a class if the start is symmetric.
+    if symmetric:
+        assert cube_engine.is_solved(start)[0], "Symmetric BFS only works from solved"
+    return cube_keys.pack(start)
+
+
+def _merge(parts):
+    return cube_keys.unique(np.concatenate(parts)) if len(parts) > 1 else parts[0]
+
+
+def next_level(level, previous, chunk_size=CHUNK_SIZE, symmetric=False, telemetry=None):
+    """
+    The sorted keys at distance d + 1 given the sorted keys at distance d and
+    d - 1. The frontier is expanded in chunks and partial results are merged
+    whenever they outgrow what has been merged so far, which keeps the
+    duplicates in memory at a constant factor of the result. The number of
+    keys expanded is reported to `telemetry` after every chunk.
+    """
+    merged = np.empty(0, dtype=cube_keys.KEY_DTYPE)
+    pending = []
+    pending_size = 0
+
+    for start in range(0, len(level), chunk_size):
+        succ = cube_keys.difference(
+            expand_keys(level[start:start + chunk_size], symmetric), level, previous
+        )
+        pending.append(succ)
+        pending_size += len(succ)
+        if telemetry is not None:
+            telemetry.update(min(start + chunk_size, len(level)))
+
+        if pending_size > max(len(merged), chunk_size):
+            merged = _merge([merged] + pending)
+            pending = []
+            pending_size = 0
+
+    return _merge([merged] + pending)
+
+
+def bfs_levels(
+    max_depth, start=cube_engine.SOLVED, chunk_size=CHUNK_SIZE, symmetric=False, telemetry=None
+):
+    """
+    Yield (depth, sorted keys of the states at exactly this distance), only
+    the representatives of their classes with symmetric.
+    """
+    previous = np.empty(0, dtype=cube_keys.KEY_DTYPE)
+    level = _start_key(start, symmetric)
+    yield 0, level
+
+    for depth in range(1, max_depth + 1):
+        if telemetry is not None:
+            later = cube_telemetry.later_work(len(level), max_depth - depth)
+            telemetry.begin("bfs", depth, len(level), later)
+        level, previous = next_level(level, previous, chunk_size, symmetric, telemetry), level
+        if telemetry is not None:
+            telemetry.end(unique=len(level), stored=len(level) + len(previous))
+        yield depth, level
+
+
+# Odd 64-bit multiplier for mixing keys before taking their high bits.
+_MIX = np.uint64(0x9E3779B97F4A7C15)
+
+
+def shard_of(keys, shards):
+    """
+    The shard (0..shards - 1) of every key. The base-6 digits of a key are
+    far from uniform in its high bits, so these are the high 32 bits of a
+    multiplicative hash of the key, scaled to the number of shards.
+    """
+    with np.errstate(over="ignore"):
+        mixed = (keys["hi"].astype(np.uint64) * _MIX ^ keys["lo"].astype(np.uint64)) * _MIX
+    return ((mixed >> np.uint64(32)) * np.uint64(shards) >> np.uint64(32)).astype(np.int64)
+
+
+def _shard_loop(shard, shards, start_key, chunk_size, symmetric, conn):
+    # Owns the keys of one shard. For every level it first expands its part of
+    # the frontier and publishes the successors grouped by their shard in a
+    # shared memory block, then collects its own successors from the blocks of
+    # all workers and deduplicates them against its part of the last levels.
+    previous = np.empty(0, dtype=cube_keys.KEY_DTYPE)
+    level = start_key if shard_of(start_key, shards)[0] == shard else previous
+    block = None
+
+    try:
+        while True:
+            command, arg = conn.recv()
+
+            if command == "expand":
+                parts = [[] for _ in range(shards)]
+                for start in range(0, len(level), chunk_size):
+                    succ = cube_keys.difference(
+                        expand_keys(level[start:start + chunk_size], symmetric), level, previous
+                    )
+                    owner = shard_of(succ, shards)
+                    for dest in range(shards):
+                        parts[dest].append(succ[owner == dest])
+                parts = [_merge(part) if part else previous[:0] for part in parts]
+
+                sizes = [len(part) for part in parts]
+                block = shared_memory.SharedMemory(create=True, size=max(1, sum(sizes)) * 16)
+                out = np.ndarray(sum(sizes), dtype=cube_keys.KEY_DTYPE, buffer=block.buf)
+                out[:] = np.concatenate(parts)
+                del out
+                conn.send(("ok", (block.name, np.cumsum([0] + sizes).tolist())))
+
+            elif command == "merge":
+                parts = []
+                for name, begin, end in arg:
+                    other = shared_memory.SharedMemory(name=name)
+                    keys = np.ndarray(end, dtype=cube_keys.KEY_DTYPE, buffer=other.buf)
+                    parts.append(keys[begin:end].copy())
+                    del keys
+                    other.close()
+                level, previous = cube_keys.difference(np.concatenate(parts), level, previous), level
+                conn.send(("ok", (len(level), level_size(level, symmetric))))
+
+            elif command == "release":
+                block.close()
+                block.unlink()
+                block = None
+                conn.send(("ok", None))
+
+            elif command == "stop":
+                return
+    finally:
+        if block is not None:
+            block.close()
+            block.unlink()
+
+
+def _shard_worker(shard, shards, start_key, chunk_size, symmetric, conn):
+    # Every reply is ("ok", value) or, if the worker fails, ("error",
+    # traceback), which _receive raises in the parent instead of letting it
+    # wait for a reply that never comes.
+    try:
+        _shard_loop(shard, shards, start_key, chunk_size, symmetric, conn)
+    except Exception:
+        conn.send(("error", traceback.format_exc()))
+    finally:
+        conn.close()
+
+
+def _receive(conn):
+    # The value of a reply of _shard_worker, raises if the worker failed.
+    try:
+        status, value = conn.recv()
+    except EOFError:
+        raise RuntimeError("A shard worker exited without a reply") from None
+    if status == "error":
+        raise RuntimeError(f"A shard worker failed:\n{value}")
+    return value
+
+
+def sharded_level_sizes(
+    max_depth,
+    processes,
+    start=cube_engine.SOLVED,
+    chunk_size=CHUNK_SIZE,
+    symmetric=False,
+    telemetry=None,
+):
+    """
+    Like bfs_levels, but every level is split by shard_of between `processes`
+    worker processes, which exchange successors through shared memory. Only
+    (depth, size, number of keys) of the levels are yielded (see
+    external_level_sizes), the keys stay in the workers, so `telemetry` only
+    gets the records at the ends of levels.
+    """
+    start_key = _start_key(start, symmetric)
+    # All workers have to share one tracker, otherwise the tracker of every
+    # worker that only attached to a block complains about it at exit.
+    resource_tracker.ensure_running()
+    conns = []
+    workers = []
+    for shard in range(processes):
+        conn, worker_conn = multiprocessing.Pipe()
+        worker = multiprocessing.Process(
+            target=_shard_worker,
+            args=(shard, processes, start_key, chunk_size, symmetric, worker_conn),
+            daemon=True,
+        )
+        worker.start()
+        # Only the worker holds its end, so a dead worker ends recv().
+        worker_conn.close()
+        conns.append(conn)
+        workers.append(worker)
+
+    try:
+        size = keys = 1
+        yield 0, size, keys
+        for depth in range(1, max_depth + 1):
+            if telemetry is not None:
+                telemetry.begin("bfs", depth, keys)
+            for conn in conns:
+                conn.send(("expand", None))
+            blocks = [_receive(conn) for conn in conns]
+
+            for shard, conn in enumerate(conns):
+                slices = [(name, offsets[shard], offsets[shard + 1]) for name, offsets in blocks]
+                conn.send(("merge", slices))
+            replies = [_receive(conn) for conn in conns]
+            expanded = keys
+            keys, size = sum(reply[0] for reply in replies), sum(reply[1] for reply in replies)
+
+            for conn in conns:
+                conn.send(("release", None))
+            for conn in conns:
+                _receive(conn)
+
+            if telemetry is not None:
+                telemetry.end(expanded, unique=keys)
+            yield depth, size, keys
+    finally:
+        for conn in conns:
+            try:
+                conn.send(("stop", None))
+            except OSError:
+                # The worker has already exited.
+                pass
+        for worker in workers:
+            worker.join()
+
+
+def open_keys(path):
+    """Memory-map a file of packed keys (or return an empty array)."""
+    if os.path.getsize(path) == 0:
+        return np.empty(0, dtype=cube_keys.KEY_DTYPE)
+    return np.memmap(path, dtype=cube_keys.KEY_DTYPE, mode="r")
+
+
+def level_path(work_dir, depth, symmetric=False):
+    return os.path.join(work_dir, f"{'sym_' if symmetric else ''}level_{depth:02d}.keys")
+
+
+def _spill_runs(level, path_prefix, buffer_size, symmetric=False, telemetry=None):
+    # Expand the level and write the successors as sorted runs of at most
+    # buffer_size keys. Returns the paths of the runs.
+    paths = []
+    pending = []
+    pending_size = 0
+    fanout = 36 if symmetric else 18
+    chunk_size = max(1, buffer_size // fanout)
+
+    for start in range(0, len(level) + 1, chunk_size):
+        if start < len(level):
+            pending.append(expand_keys(np.asarray(level[start:start + chunk_size]), symmetric))
+            pending_size += len(pending[-1])
+            if telemetry is not None:
+                telemetry.update(min(start + chunk_size, len(level)))
+
+        if pending and (pending_size + fanout * chunk_size > buffer_size or start + chunk_size >= len(level)):
+            paths.append(f"{path_prefix}.{len(paths):04d}")
+            cube_keys.unique(np.concatenate(pending)).tofile(paths[-1])
+            pending = []
+            pending_size = 0
+
+    return paths
+
+
+def _merge_runs(runs, block_size):
+    # Vectorized k-way merge. Every round reads the next block of every run
+    # and outputs, deduplicated, all keys up to the smallest last key of the
+    # blocks: no key that comes later in any run can be smaller.
+    positions = [0] * len(runs)
+
+    while True:
+        active = [i for i, run in enumerate(runs) if positions[i] < len(run)]
+        if not active:
+            return
+
+        blocks = {i: np.asarray(runs[i][positions[i]:positions[i] + block_size]) for i in active}
+        bound = np.sort(np.concatenate([cube_keys.as_void(blocks[i][-1:]) for i in active]))[:1]
+
+        parts = []
+        for i in active:
+            n = np.searchsorted(cube_keys.as_void(blocks[i]), bound, side="right")[0]
+            parts.append(blocks[i][:n])
+            positions[i] += n
+
+        yield cube_keys.unique(np.concatenate(parts))
+
+
+def _drop_known(keys, level):
+    # Keys not in the sorted on-disk level, reading only the part of the level
+    # between the smallest and the largest of the (sorted) keys.
+    if len(keys) == 0 or len(level) == 0:
+        return keys
+    table = cube_keys.as_void(level)
+    begin = np.searchsorted(table, cube_keys.as_void(keys[:1]))[0]
+    end = np.searchsorted(table, cube_keys.as_void(keys[-1:]), side="right")[0]
+    return keys[~cube_keys.contains(np.asarray(level[begin:end]), keys)]
+
+
+def external_level_sizes(
+    max_depth,
+    work_dir,
+    start=cube_engine.SOLVED,
+    buffer_size=1 << 24,
+    symmetric=False,
+    telemetry=None,
+):
+    """
+    Like bfs_levels, but the levels live in work_dir as sorted key files and
+    at most about buffer_size keys (16 bytes each) are in memory at a time.
+    Yields (depth, size, number of keys) of the levels: the size is that of
+    level_size, the keys are the states expanded, with symmetric only one
+    per class.
+
+    Successors are spilled as sorted runs, which are then k-way merged and
+    stripped of the keys of the current and previous level. Levels that
+    already exist in work_dir are reused, so an interrupted run resumes at
+    the first missing level. Symmetric levels have their own files.
+    """
+    os.makedirs(work_dir, exist_ok=True)
+    if not os.path.exists(level_path(work_dir, 0, symmetric)):
+        _start_key(start, symmetric).tofile(level_path(work_dir, 0, symmetric))
+    level = open_keys(level_path(work_dir, 0, symmetric))
+    yield 0, level_size(level, symmetric), len(level)
+
+    for depth in range(1, max_depth + 1):
+        path = level_path(work_dir, depth, symmetric)
+
+        if not os.path.exists(path):
+            level = open_keys(level_path(work_dir, depth - 1, symmetric))
+            previous = (
+                open_keys(level_path(work_dir, depth - 2, symmetric)) if depth > 1 else level[:0]
+            )
+
+            if telemetry is not None:
+                later = cube_telemetry.later_work(len(level), max_depth - depth)
+                telemetry.begin("bfs", depth, len(level), later)
+            run_paths = _spill_runs(level, path + ".run", buffer_size, symmetric, telemetry)
+            runs = [open_keys(run_path) for run_path in run_paths]
+            block_size = max(1, buffer_size // (2 * len(runs) + 2))
+
+            with open(path + ".tmp", "wb") as f:
+                for keys in _merge_runs(runs, block_size):
+                    _drop_known(_drop_known(keys, level), previous).tofile(f)
+
+            del runs
+            for run_path in run_paths:
+                os.remove(run_path)
+            os.replace(path + ".tmp", path)
+            if telemetry is not None:
+                telemetry.end(unique=len(open_keys(path)))
+
+        level = open_keys(path)
+        yield depth, level_size(level, symmetric), len(level)
+
+
+def depth_counts(
+    max_depth,
+    start=cube_engine.SOLVED,
+    chunk_size=CHUNK_SIZE,
+    processes=1,
+    work_dir=None,
+    symmetric=False,
+    verbose=False,
+    telemetry=None,
+):
+    """
+    Number of states at each distance 0..max_depth from the start, which
+    has to be solved with symmetric (see bfs_levels).
+    """
+    if work_dir is not None:
+        levels = external_level_sizes(
+            max_depth, work_dir, start, 18 * chunk_size, symmetric, telemetry
+        )
+    elif processes > 1:
+        levels = sharded_level_sizes(max_depth, processes, start, chunk_size, symmetric, telemetry)
+    else:
+        levels = (
+            (depth, level_size(level, symmetric), len(level))
+            for depth, level in bfs_levels(max_depth, start, chunk_size, symmetric, telemetry)
+        )
+
+    counts = []
+    key_counts = []
+    level_time = time.time()
+    # With symmetric, only one key per class is expanded, by 18 moves of the
+    # state and of its inverse.
+    fanout = 36 if symmetric else 18
+
+    for depth, size, keys in levels:
+        counts.append(size)
+        key_counts.append(keys)
+        if verbose:
+            now = time.time()
+            expanded = key_counts[-2] * fanout if depth > 0 else 0
+            print(
+                f"depth {depth:2d}: {counts[-1]:>13,d} states, "
+                f"{sum(counts):>13,d} total, {now - level_time:8.2f} s, "
+                f"{expanded / max(now - level_time, 1e-9):>12,.0f} expanded/s"
+            )
+            level_time = now
+
+    return counts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Count cube states by distance from solved.")
+    parser.add_argument("max_depth", type=int)
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument(
+        "--processes", type=int, default=1, help="split every level between this many processes"
+    )
+    parser.add_argument("--output", help="write the counts as JSON to this file")
+    parser.add_argument(
+        "--symmetric",
+        action="store_true",
+        help="keep one state per class of symmetric states and inverses",
+    )
+    parser.add_argument(
+        "--work-dir", help="keep the levels in this directory instead of in memory"
+    )
+    parser.add_argument("--telemetry", help="append JSON lines of the progress to this file")
+    parser.add_argument("--progress", action="store_true", help="show the progress with tqdm")
+    args = parser.parse_args()
+
+    with cube_telemetry.Telemetry(args.telemetry, progress=args.progress) as telemetry:
+        counts = depth_counts(
+            args.max_depth,
+            chunk_size=args.chunk_size,
+            processes=args.processes,
+            work_dir=args.work_dir,
+            symmetric=args.symmetric,
+            verbose=True,
+            telemetry=telemetry,
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(
+                {
+                    "depth": list(range(len(counts))),
+                    "count": counts,
+                    "cumulative": np.cumsum(counts).tolist(),
+                },
+                f,
+                indent=2,
+            )
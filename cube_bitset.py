@@ -0,0 +1,366 @@
+"""
+Bitsets of hashed states, in the file format of code/filip.cpp.
+
+filip.cpp marks every state it reaches in a std::bitset of BITSET_SIZE =
+2^35 bits, at hash_state(state, P, BITSET_SIZE - 1), and save_bitset writes
+it as BITSET_SIZE / 8 raw bytes (4 GiB), bit j of byte i being bit 8 i + j.
+parse_bitset reads that back with one fscanf per byte; here the file is
+only memory-mapped, and hashing, setting, testing and counting work on
+whole batches of states.
+
+That is enough to run the crosscheck phase of filip.cpp in Python against a
+bitset that the C++ tool has built: the states at max_depth moves from the
+superflip whose crosscheck hash is in the bitset of the solved side.
+
+    python cube_bitset.py 8 P OUT --from-superflip --crosscheck-p Q --crosscheck IN
+
+With one hash, the bitset fills up at depth 9 and most crosscheck hits are
+false positives. A BloomFilter sets the bits of k hashes with different
+bases instead and is sized for a target false-positive rate (--fp-rate, the
+bases are saved next to the bitset in OUT.json). Its hashes are the top
+bits of the same base-P numbers: the low bits that hash_state keeps satisfy
+the same congruences for every odd base, which made a filter with the C++
+hashes ~100 times worse than its expected rate. Hits can be confirmed
+against the states of a cube_index file (--index), which counts how many of
+them were false positives:
+
+    python cube_bitset.py 8 P OUT --fp-rate 0.001
+    python cube_bitset.py 8 Q OUT2 --from-superflip --crosscheck OUT --index index_8.bin
+"""
+import argparse
+import functools
+import json
+import math
+import os
+import time
+
+import numpy as np
+
+import cube_engine
+import cube_index
+import cube_keys
+import cube_sequences
+import cube_telemetry
+
+BITSET_SIZE = 1 << 35
+
+# Same as SUPERFLIP in code/filip.cpp.
+SUPERFLIP = cube_engine.from_string(
+    "CFCBECAC" "BCBACAECEFCF" "FABEAFEB" "BDBADAEDEFDF" "DADBEDFD"
+)
+SUPERFLIP.flags.writeable = False
+
+
+@functools.lru_cache(maxsize=None)
+def _powers(p):
+    # P^47 .. P^0 modulo 2^64, the place values of the cells.
+    powers = np.array([pow(p, 47 - i, 1 << 64) for i in range(48)], dtype=np.uint64)
+    powers.flags.writeable = False
+    return powers
+
+
+def hash_states(states, p, mod_mask=BITSET_SIZE - 1):
+    """
+    hash_state of filip.cpp for a batch of states: the base-P number of the
+    48 cells in a wrapping 64-bit signed integer, shifted right by one (it is
+    always even for an odd P) and masked with mod_mask.
+    """
+    states = np.asarray(states, dtype=np.uint8).reshape(-1, 48)
+    hashes = (states.astype(np.uint64) @ _powers(p)).view(np.int64)
+    return (hashes >> 1) & np.int64(mod_mask)
+
+
+def top_hash_states(states, p, size):
+    """
+    The top log2(size) bits of the base-P numbers that hash_states takes
+    the low bits of, which depend on all the cells for any base.
+    """
+    states = np.asarray(states, dtype=np.uint8).reshape(-1, 48)
+    hashes = states.astype(np.uint64) @ _powers(p)
+    return (hashes >> np.uint64(64 - (size.bit_length() - 1))).astype(np.int64)
+
+
+class Bitset:
+    """
+    A bitset over a uint8 array in the byte order of save_bitset, usually a
+    memory-mapped file.
+    """
+
+    def __init__(self, data, mapping=None):
+        self.data = data
+        self.mapping = mapping
+        self.size = 8 * len(data)
+
+    @classmethod
+    def zeros(cls, size=BITSET_SIZE):
+        """An empty bitset in memory."""
+        return cls(np.zeros(size // 8, dtype=np.uint8))
+
+    @classmethod
+    def open(cls, path, writable=False):
+        return cls(*cube_keys.map_bytes(path, writable))
+
+    @classmethod
+    def create(cls, path, size=BITSET_SIZE):
+        """An empty bitset in a new (sparse) file, mapped for writing."""
+        with open(path, "wb") as f:
+            f.truncate(size // 8)
+        return cls.open(path, writable=True)
+
+    def set(self, indices):
+        """Set the given bits (vectorized, duplicates are fine)."""
+        indices = np.asarray(indices, dtype=np.int64)
+        bits = np.left_shift(1, indices & 7).astype(np.uint8)
+        np.bitwise_or.at(self.data, indices >> 3, bits)
+
+    def test(self, indices):
+        """Whether each of the given bits is set."""
+        indices = np.asarray(indices, dtype=np.int64)
+        return (self.data[indices >> 3] >> (indices & 7).astype(np.uint8) & 1).astype(bool)
+
+    def count(self, chunk_size=1 << 26):
+        """The number of set bits, std::bitset::count."""
+        return sum(
+            int(np.bitwise_count(self.data[start:start + chunk_size]).sum(dtype=np.int64))
+            for start in range(0, len(self.data), chunk_size)
+        )
+
+    def flush(self):
+        if self.mapping is not None:
+            self.mapping.flush()
+
+    def save(self, path):
+        np.asarray(self.data).tofile(path + ".tmp")
+        os.replace(path + ".tmp", path)
+
+
+def hash_bases(k, first):
+    """k odd hash bases: `first` and k - 1 more derived from it."""
+    rng = np.random.default_rng(first & 0xFFFFFFFFFFFFFFFF)
+    return [first] + [2 * int(x) + 1 for x in rng.integers(1 << 61, 1 << 62, k - 1)]
+
+
+def bloom_size(capacity, fp_rate):
+    """
+    The number of bits (a power of two) and of hashes for a Bloom filter of
+    `capacity` states with at most the given false-positive rate.
+    """
+    bits = -capacity * math.log(fp_rate) / math.log(2) ** 2
+    size = max(8, 1 << math.ceil(math.log2(max(bits, 1))))
+    k = max(1, round(size / capacity * math.log(2)))
+    return size, k
+
+
+class BloomFilter:
+    """
+    A set of states in a Bitset with false positives: adding a state sets the
+    bits of its top_hash_states with each of the bases, and a state might be
+    in the set if all of them are set. With filip_hash and one base, this is
+    a bitset of filip.cpp.
+    """
+
+    def __init__(self, bitset, bases, filip_hash=False):
+        self.bitset = bitset
+        self.bases = [int(p) for p in bases]
+        self.filip_hash = filip_hash
+
+    @classmethod
+    def for_capacity(cls, capacity, fp_rate, first_base):
+        """An empty Bloom filter in memory, see bloom_size."""
+        size, k = bloom_size(capacity, fp_rate)
+        return cls(Bitset.zeros(size), hash_bases(k, first_base))
+
+    @classmethod
+    def open(cls, path, bases=None):
+        """Map a saved filter, or a bitset of filip.cpp with bases=[P]."""
+        if bases is not None:
+            return cls(Bitset.open(path), bases, filip_hash=True)
+        with open(path + ".json") as f:
+            meta = json.load(f)
+        return cls(Bitset.open(path), meta["bases"], meta["filip_hash"])
+
+    def save(self, path):
+        self.bitset.save(path)
+        meta = {"size": self.bitset.size, "bases": self.bases, "filip_hash": self.filip_hash}
+        with open(path + ".json", "w") as f:
+            json.dump(meta, f, indent=2)
+
+    def _hashes(self, states, p):
+        if self.filip_hash:
+            return hash_states(states, p, self.bitset.size - 1)
+        return top_hash_states(states, p, self.bitset.size)
+
+    def add(self, states):
+        for p in self.bases:
+            self.bitset.set(self._hashes(states, p))
+
+    def might_contain(self, states):
+        """Whether each state might have been added (vectorized)."""
+        states = np.asarray(states, dtype=np.uint8).reshape(-1, 48)
+        candidates = np.arange(len(states))
+        # Every hash only sees the states that the ones before kept.
+        for p in self.bases:
+            candidates = candidates[self.bitset.test(self._hashes(states[candidates], p))]
+        res = np.zeros(len(states), dtype=bool)
+        res[candidates] = True
+        return res
+
+    def false_positive_rate(self):
+        """The expected false-positive rate at the current fill of the bitset."""
+        return (self.bitset.count() / self.bitset.size) ** len(self.bases)
+
+
+def explore(
+    max_depth,
+    p,
+    bitset,
+    start=cube_engine.SOLVED,
+    crosscheck_p=None,
+    crosscheck=None,
+    symmetrical=False,
+    batch_size=1 << 16,
+    telemetry=None,
+):
+    """
+    explore_states of filip.cpp: set the hashes (with mask bitset.size - 1)
+    of the states at the end of all canonical sequences of max_depth moves
+    from start, and with a crosscheck bitset only of those whose hash with
+    crosscheck_p is in it. With symmetrical, the first move only turns face
+    A, like filip.cpp does from the superflip. Returns the number of
+    sequences explored. See explore_bloom for Bloom filters.
+    """
+    bloom = BloomFilter(bitset, [p], filip_hash=True)
+    if crosscheck is not None:
+        crosscheck = BloomFilter(crosscheck, [crosscheck_p], filip_hash=True)
+    stats = explore_bloom(
+        max_depth,
+        bloom,
+        start,
+        crosscheck,
+        symmetrical=symmetrical,
+        batch_size=batch_size,
+        telemetry=telemetry,
+    )
+    return stats["explored"]
+
+
+def explore_bloom(
+    max_depth,
+    bloom,
+    start=cube_engine.SOLVED,
+    crosscheck=None,
+    exact=None,
+    symmetrical=False,
+    batch_size=1 << 16,
+    telemetry=None,
+):
+    """
+    Like explore, but add the states at the end of all canonical sequences
+    of max_depth moves from start to the Bloom filter, with a crosscheck
+    filter only those that might be in it.
+
+    Crosscheck hits can be confirmed with `exact`, anything with depth_of
+    like a cube_index.Ball, and then only the confirmed ones are added.
+    Returns counts of the sequences explored and of the crosscheck hits,
+    confirmed and rejected. These and the fill of the filter also go to
+    `telemetry`, the fill only when a record is due: it counts all the bits.
+    """
+    stop = 3 * cube_sequences.count(max_depth - 1, 0) if symmetrical and max_depth > 0 else None
+    stats = {"explored": 0, "hits": 0, "confirmed": 0, "rejected": 0}
+    if telemetry is not None:
+        telemetry.begin("explore", max_depth, cube_sequences.count(max_depth) if stop is None else stop)
+
+    for moves in cube_sequences.sequences(max_depth, 0, stop, batch_size):
+        stats["explored"] += len(moves)
+        states = cube_sequences.apply_sequences(start, moves)
+        if crosscheck is not None:
+            states = states[crosscheck.might_contain(states)]
+            stats["hits"] += len(states)
+        if crosscheck is not None and exact is not None:
+            found = exact.depth_of(states) >= 0
+            stats["confirmed"] += int(found.sum())
+            stats["rejected"] += int((~found).sum())
+            states = states[found]
+        bloom.add(states)
+        if telemetry is not None:
+            fill = {"fill": bloom.bitset.count() / bloom.bitset.size} if telemetry.due() else {}
+            telemetry.update(stats["explored"], **fill, **stats)
+
+    if telemetry is not None:
+        telemetry.end(stats["explored"], fill=bloom.bitset.count() / bloom.bitset.size, **stats)
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Hash the states at a given depth into a bitset, like code/filip.cpp."
+    )
+    parser.add_argument("max_depth", type=int)
+    parser.add_argument("p", type=int, metavar="P", help="odd hash base")
+    parser.add_argument("output", help="bitset file to write")
+    parser.add_argument("--from-superflip", action="store_true", help="start from the superflip")
+    parser.add_argument(
+        "--crosscheck-p", type=int, help="hash base of a crosscheck bitset of filip.cpp"
+    )
+    parser.add_argument(
+        "--crosscheck", help="only keep states in this bitset (filip.cpp) or Bloom filter"
+    )
+    parser.add_argument("--index", help="confirm crosscheck hits with this index (see cube_index)")
+    parser.add_argument("--size", type=int, default=BITSET_SIZE, help="bits, a power of two")
+    parser.add_argument(
+        "--fp-rate", type=float, help="write a Bloom filter sized for this false-positive rate"
+    )
+    parser.add_argument("--batch-size", type=int, default=1 << 16)
+    parser.add_argument("--telemetry", help="append JSON lines of the progress to this file")
+    parser.add_argument("--progress", action="store_true", help="show the progress with tqdm")
+    args = parser.parse_args()
+    assert args.size & (args.size - 1) == 0 and args.size >= 8, "The size must be a power of two"
+    if args.index and not args.crosscheck:
+        parser.error("--index confirms crosscheck hits, it needs --crosscheck")
+
+    crosscheck = None
+    if args.crosscheck:
+        bases = None if args.crosscheck_p is None else [args.crosscheck_p]
+        crosscheck = BloomFilter.open(args.crosscheck, bases)
+        print(f"Crosscheck utility: {crosscheck.bitset.count()} / {crosscheck.bitset.size}")
+    exact = cube_index.StateIndex(args.index) if args.index else None
+
+    # Built in memory and then saved, like filip.cpp does: setting bits in a
+    # file mapping costs a page fault for nearly every bit.
+    if args.fp_rate:
+        sequences = cube_sequences.count(args.max_depth)
+        bloom = BloomFilter.for_capacity(sequences, args.fp_rate, args.p)
+        print(f"Bloom filter of {bloom.bitset.size:,d} bits, {len(bloom.bases)} hashes")
+    else:
+        bloom = BloomFilter(Bitset.zeros(args.size), [args.p], filip_hash=True)
+
+    start_time = time.time()
+    with cube_telemetry.Telemetry(args.telemetry, progress=args.progress) as telemetry:
+        stats = explore_bloom(
+            args.max_depth,
+            bloom,
+            SUPERFLIP if args.from_superflip else cube_engine.SOLVED,
+            crosscheck,
+            exact,
+            symmetrical=args.from_superflip,
+            batch_size=args.batch_size,
+            telemetry=telemetry,
+        )
+    if args.fp_rate:
+        bloom.save(args.output)
+    else:
+        bloom.bitset.save(args.output)
+    print(f"{stats['explored']:,d} sequences in {time.time() - start_time:.2f} s")
+    print(f"Bitset utility: {bloom.bitset.count()} / {bloom.bitset.size}")
+
+    if crosscheck is not None:
+        print(
+            f"crosscheck: {stats['hits']:,d} hits, expected false-positive rate "
+            f"{crosscheck.false_positive_rate():.3g}"
+        )
+    if exact is not None:
+        negatives = stats["explored"] - stats["confirmed"]
+        print(
+            f"{stats['confirmed']:,d} confirmed, {stats['rejected']:,d} rejected, "
+            f"measured false-positive rate {stats['rejected'] / max(negatives, 1):.3g}"
+        )
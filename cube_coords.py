@@ -0,0 +1,359 @@
+"""
+Cubie-level and coordinate representations of the cube.
+
+A cube is described by its 8 corner and 12 edge cubies: which cubie sits in
+every position (cp, ep) and how it is twisted or flipped there (co, eo). The
+positions are numbered as in Kociemba's solver (http://kociemba.org/cube.htm):
+
+    corners: URF UFL ULB UBR DFR DLF DBL DRB
+    edges:   UR UF UL UB DR DF DL DB FR FL BL BR
+
+Coordinates squeeze each part into a single integer:
+
+    cp    corner permutation,            8! = 40320
+    co    corner orientation,           3^7 = 2187
+    ep_a  positions of edges UR..DF,  12P6 = 665280
+    ep_b  positions of edges DL..BR,  12P6 = 665280
+    eo    edge orientation,            2^11 = 2048
+
+The edge permutation (12! = 479001600) is too large for a move table, so it
+is carried as ep_a and ep_b, which together determine it; edge_permutation()
+returns the full 12! rank. Every coordinate has an int32 move table and a
+move is five table lookups.
+
+Conversions to and from the 48 cell layout of cube_engine are lossless.
+"""
+import functools
+
+import numpy as np
+
+import cube_engine
+
+# Cells of every corner position, starting with the U/D cell, clockwise.
+CORNER_CELLS = np.array(
+    [[7, 14, 13], [5, 11, 10], [0, 8, 19], [2, 17, 16],
+     [42, 33, 34], [40, 30, 31], [45, 39, 28], [47, 36, 37]]
+)
+# Cells of every edge position, starting with the U/D (or F/B) cell.
+EDGE_CELLS = np.array(
+    [[4, 15], [6, 12], [3, 9], [1, 18], [44, 35], [41, 32],
+     [43, 29], [46, 38], [23, 24], [22, 21], [27, 20], [26, 25]]
+)
+CORNER_COLORS = cube_engine.SOLVED[CORNER_CELLS]
+EDGE_COLORS = cube_engine.SOLVED[EDGE_CELLS]
+
+COORD_DTYPE = np.dtype(
+    [("cp", "<i4"), ("co", "<i4"), ("ep_a", "<i4"), ("ep_b", "<i4"), ("eo", "<i4")]
+)
+COORD_SIZES = {"cp": 40320, "co": 2187, "ep_a": 665280, "ep_b": 665280, "eo": 2048}
+
+
+def _corner_lookup():
+    # Colors of a corner read from its U/D cell clockwise -> cubie index.
+    lookup = np.full(6 ** 3, -1, dtype=np.int8)
+    for j, (c0, c1, c2) in enumerate(CORNER_COLORS):
+        lookup[(c0 * 6 + c1) * 6 + c2] = j
+    return lookup
+
+
+def _edge_lookup():
+    # Colors of an edge -> cubie index + 12 * flip.
+    lookup = np.full(6 ** 2, -1, dtype=np.int8)
+    for j, (c0, c1) in enumerate(EDGE_COLORS):
+        lookup[c0 * 6 + c1] = j
+        lookup[c1 * 6 + c0] = j + 12
+    return lookup
+
+
+_CORNER_LOOKUP = _corner_lookup()
+_EDGE_LOOKUP = _edge_lookup()
+
+
+def stickers_to_cubies(states):
+    """
+    Turn an N x 48 batch of states into cubie arrays (cp, co, ep, eo).
+
+    Positions whose colors do not form a real cubie get cp/ep -1, so that
+    callers can check the input; this function does not check anything else.
+    """
+    states = np.asarray(states, dtype=np.uint8).reshape(-1, 48)
+    n = len(states)
+
+    colors = states[:, CORNER_CELLS].astype(np.int64)
+    co = np.argmax((colors == 2) | (colors == 3), axis=2)
+    rotated = np.take_along_axis(colors, (co[:, :, None] + np.arange(3)) % 3, axis=2)
+    cp = _CORNER_LOOKUP[(rotated[:, :, 0] * 6 + rotated[:, :, 1]) * 6 + rotated[:, :, 2]]
+
+    colors = states[:, EDGE_CELLS].astype(np.int64)
+    edges = _EDGE_LOOKUP[colors[:, :, 0] * 6 + colors[:, :, 1]]
+    ep = np.where(edges >= 0, edges % 12, -1)
+    eo = (edges >= 12).astype(np.int8)
+
+    return (
+        cp.astype(np.int8).reshape(n, 8),
+        co.astype(np.int8).reshape(n, 8),
+        ep.astype(np.int8).reshape(n, 12),
+        eo.reshape(n, 12),
+    )
+
+
+def cubies_to_stickers(cubies):
+    cp, co, ep, eo = [np.asarray(a, dtype=np.int64).reshape(-1, a.shape[-1]) for a in cubies]
+    states = cube_engine.solved(len(cp))
+    rows = np.arange(len(cp))[:, None]
+
+    for k in range(3):
+        cells = CORNER_CELLS[np.arange(8), (k + co) % 3]
+        states[rows, cells] = CORNER_COLORS[cp, k]
+    for k in range(2):
+        cells = EDGE_CELLS[np.arange(12), (k + eo) % 2]
+        states[rows, cells] = EDGE_COLORS[ep, k]
+
+    return states
+
+
+def _gather(values, perm):
+    shape = np.broadcast_shapes(values.shape, perm.shape)
+    perm = np.broadcast_to(perm, shape).astype(np.int64)
+    return np.take_along_axis(np.broadcast_to(values, shape), perm, axis=-1)
+
+
+def multiply(a, b):
+    """
+    Cubie arrays of the state a followed by the state b (for example a move).
+    Either argument may be a single state broadcast over the other's batch.
+    """
+    a_cp, a_co, a_ep, a_eo = a
+    b_cp, b_co, b_ep, b_eo = b
+    return (
+        _gather(a_cp, b_cp),
+        ((_gather(a_co, b_cp) + b_co) % 3).astype(np.int8),
+        _gather(a_ep, b_ep),
+        ((_gather(a_eo, b_ep) + b_eo) % 2).astype(np.int8),
+    )
+
+
+def invert(cubies):
+    """Cubie arrays of the inverse states."""
+    cp, co, ep, eo = cubies
+    inv_cp = np.argsort(cp, axis=-1).astype(np.int8)
+    inv_ep = np.argsort(ep, axis=-1).astype(np.int8)
+    return (
+        inv_cp,
+        ((3 - _gather(co, inv_cp)) % 3).astype(np.int8),
+        inv_ep,
+        _gather(eo, inv_ep).astype(np.int8),
+    )
+
+
+SOLVED_CUBIES = stickers_to_cubies(cube_engine.SOLVED)
+
+# Cubie arrays of the 18 moves, in the order of cube_engine.MOVE_NAMES.
+MOVE_CUBIES = stickers_to_cubies(cube_engine.SOLVED[cube_engine.MOVE_PERMS])
+
+
+def _rank_permutation(perm):
+    # Lehmer code of every row of an N x n array of permutations.
+    perm = np.asarray(perm, dtype=np.int64)
+    n = perm.shape[1]
+    rank = np.zeros(len(perm), dtype=np.int64)
+    for i in range(n):
+        smaller = (perm[:, i + 1:] < perm[:, i:i + 1]).sum(axis=1)
+        rank = rank * (n - i) + smaller
+    return rank
+
+
+def _unrank_positions(rank, k, n):
+    # Inverse of _rank_positions, also of _rank_permutation when k == n.
+    rank = np.asarray(rank, dtype=np.int64).copy()
+    digits = np.empty((len(rank), k), dtype=np.int64)
+    for i in range(k - 1, -1, -1):
+        rank, digits[:, i] = np.divmod(rank, n - i)
+
+    free = np.ones((len(rank), n), dtype=bool)
+    res = np.empty((len(rank), k), dtype=np.int64)
+    rows = np.arange(len(rank))
+    for i in range(k):
+        res[:, i] = np.argmax(np.cumsum(free, axis=1) > digits[:, i:i + 1], axis=1)
+        free[rows, res[:, i]] = False
+    return res
+
+
+def _rank_positions(pos, n):
+    # Rank of k distinct positions out of n, in order, as a number < nPk.
+    pos = np.asarray(pos, dtype=np.int64)
+    rank = np.zeros(len(pos), dtype=np.int64)
+    for i in range(pos.shape[1]):
+        smaller = (pos[:, :i] < pos[:, i:i + 1]).sum(axis=1)
+        rank = rank * (n - i) + pos[:, i] - smaller
+    return rank
+
+
+def _rank_digits(digits, base):
+    rank = np.zeros(len(digits), dtype=np.int64)
+    for i in range(digits.shape[1] - 1):
+        rank = rank * base + digits[:, i]
+    return rank
+
+
+def _unrank_digits(rank, base, n):
+    # The last digit is implied by the sum of all digits being 0 mod base.
+    rank = np.asarray(rank, dtype=np.int64).copy()
+    digits = np.empty((len(rank), n), dtype=np.int64)
+    for i in range(n - 2, -1, -1):
+        rank, digits[:, i] = np.divmod(rank, base)
+    digits[:, n - 1] = -digits[:, :n - 1].sum(axis=1) % base
+    return digits
+
+
+def encode(cubies):
+    """Coordinates of a batch of cubie arrays."""
+    cp, co, ep, eo = [np.asarray(a).reshape(-1, a.shape[-1]) for a in cubies]
+    edge_positions = np.argsort(ep, axis=1)
+
+    coords = np.empty(len(cp), dtype=COORD_DTYPE)
+    coords["cp"] = _rank_permutation(cp)
+    coords["co"] = _rank_digits(co, 3)
+    coords["ep_a"] = _rank_positions(edge_positions[:, :6], 12)
+    coords["ep_b"] = _rank_positions(edge_positions[:, 6:], 12)
+    coords["eo"] = _rank_digits(eo, 2)
+    return coords
+
+
+def decode(coords):
+    """Cubie arrays of a batch of coordinates."""
+    coords = np.asarray(coords, dtype=COORD_DTYPE).reshape(-1)
+    rows = np.arange(len(coords))[:, None]
+
+    ep = np.empty((len(coords), 12), dtype=np.int8)
+    ep[rows, _unrank_positions(coords["ep_a"], 6, 12)] = np.arange(6)
+    ep[rows, _unrank_positions(coords["ep_b"], 6, 12)] = np.arange(6, 12)
+
+    return (
+        _unrank_positions(coords["cp"], 8, 8).astype(np.int8),
+        _unrank_digits(coords["co"], 3, 8).astype(np.int8),
+        ep,
+        _unrank_digits(coords["eo"], 2, 12).astype(np.int8),
+    )
+
+
+def from_stickers(states):
+    cubies = stickers_to_cubies(states)
+    assert (cubies[0] >= 0).all() and (cubies[2] >= 0).all(), "Not a valid cube state"
+    return encode(cubies)
+
+
+def to_stickers(coords):
+    return cubies_to_stickers(decode(coords))
+
+
+def edge_permutation(coords):
+    """The full edge permutation coordinate (< 12!) of a batch of coordinates."""
+    return _rank_permutation(decode(coords)[2])
+
+
+def rank_permutation(perm):
+    """The rank (< n!) of every row of an N x n array of permutations."""
+    return _rank_permutation(perm)
+
+
+def unrank_permutation(rank, n):
+    """Inverse of rank_permutation, an N x n array."""
+    return _unrank_positions(rank, n, n)
+
+
+def edge_positions(ep):
+    """The positions of the six edges tracked by ep_a or ep_b values, N x 6."""
+    return _unrank_positions(ep, 6, 12)
+
+
+def permutation_parity(perm):
+    """0 for the even and 1 for the odd rows of an N x n array of permutations."""
+    perm = np.asarray(perm)
+    n = perm.shape[1]
+    inversions = sum((perm[:, i:i + 1] > perm[:, i + 1:]).sum(axis=1) for i in range(n - 1))
+    return inversions % 2
+
+
+SOLVED_COORDS = encode(SOLVED_CUBIES)[0]
+
+
+@functools.lru_cache(maxsize=None)
+def move_table(name):
+    """
+    The int32 move table of one coordinate: table[x, m] is the value of the
+    coordinate after applying move m to a cube with value x. Built on first
+    use, which takes a few seconds for the edge permutation coordinates.
+    """
+    cp, co, ep, eo = MOVE_CUBIES
+    inv_ep = np.argsort(ep, axis=1)
+
+    decode_values, move_values, encode_values = {
+        "cp": (
+            lambda x: _unrank_positions(x, 8, 8),
+            lambda v, m: v[:, cp[m]],
+            _rank_permutation,
+        ),
+        "co": (
+            lambda x: _unrank_digits(x, 3, 8),
+            lambda v, m: (v[:, cp[m]] + co[m]) % 3,
+            lambda v: _rank_digits(v, 3),
+        ),
+        # Instead of which edge is where, these track where each edge is.
+        "ep_a": (
+            lambda x: _unrank_positions(x, 6, 12),
+            lambda v, m: inv_ep[m][v],
+            lambda v: _rank_positions(v, 12),
+        ),
+        "ep_b": (
+            lambda x: _unrank_positions(x, 6, 12),
+            lambda v, m: inv_ep[m][v],
+            lambda v: _rank_positions(v, 12),
+        ),
+        "eo": (
+            lambda x: _unrank_digits(x, 2, 12),
+            lambda v, m: (v[:, ep[m]] + eo[m]) % 2,
+            lambda v: _rank_digits(v, 2),
+        ),
+    }[name]
+
+    values = decode_values(np.arange(COORD_SIZES[name]))
+    table = np.empty((COORD_SIZES[name], 18), dtype=np.int32)
+    for m in range(18):
+        table[:, m] = encode_values(move_values(values, m))
+    table.flags.writeable = False
+    return table
+
+
+def move_tables():
+    """A dict of the move tables (see move_table) of all coordinates."""
+    return {name: move_table(name) for name in COORD_DTYPE.names}
+
+
+def apply_move(coords, move):
+    """Apply one move to a batch of coordinates, one lookup per coordinate."""
+    move = cube_engine.move_index(move)
+    tables = move_tables()
+    res = np.empty(coords.shape, dtype=COORD_DTYPE)
+    for name in COORD_DTYPE.names:
+        res[name] = tables[name][coords[name], move]
+    return res
+
+
+def apply_moves(coords, moves):
+    for move in moves:
+        coords = apply_move(coords, move)
+    return coords
+
+
+def expand(coords):
+    """
+    Apply all 18 moves to every state, the successor of coords[i] by move m
+    is at index i * 18 + m, like in cube_engine.expand.
+    """
+    coords = np.asarray(coords, dtype=COORD_DTYPE).reshape(-1)
+    tables = move_tables()
+    res = np.empty((len(coords), 18), dtype=COORD_DTYPE)
+    for name in COORD_DTYPE.names:
+        res[name] = tables[name][coords[name]]
+    return res.reshape(-1)
@@ -0,0 +1,148 @@
+"""
+A pure-data Rubik's cube engine for searching over many states at once.
+
+States use the same layout as code/rubik_mitm_solution.cpp: 48 cells with
+the face centers left out, each holding a color 0..5 (the C++ 'A'..'F').
+A batch of states is an N x 48 uint8 array and a move is a gather along the
+second axis, so one numpy call turns a whole batch.
+
+The cell numbering (see also code/filip.cpp):
+
+           ------------
+           |  0  1  2 |
+           |  3  C  4 |
+           |  5  6  7 |
+---------------------------------------------
+|  8  9 10 | 11 12 13 | 14 15 16 | 17 18 19 |
+| 20  B 21 | 22  A 23 | 24  E 25 | 26  F 27 |
+| 28 29 30 | 31 32 33 | 34 35 36 | 37 38 39 |
+---------------------------------------------
+           | 40 41 42 |
+           | 43  D 44 |
+           | 45 46 47 |
+           ------------
+
+A = F(ront), B = L(eft), C = U(p), D = D(own), E = R(ight), F = B(ack)
+"""
+import numpy as np
+
+# Face names in the order of the C++ faces A..F.
+FACES = "FLUDRB"
+
+# Opposite faces sum to 5, which is what the pruning in explore_states relies on.
+OPPOSITE_FACE = [5 - face for face in range(6)]
+
+# Bumped whenever the cell layout or the moves change, so that data saved
+# from states (like the ball cache of cube_ball) can tell it is stale.
+VERSION = 1
+
+SOLVED = np.array(
+    [2] * 8
+    + [1] * 3 + [0] * 3 + [4] * 3 + [5] * 3
+    + [1] * 2 + [0] * 2 + [4] * 2 + [5] * 2
+    + [1] * 3 + [0] * 3 + [4] * 3 + [5] * 3
+    + [3] * 8,
+    dtype=np.uint8,
+)
+SOLVED.flags.writeable = False
+
+# Copied from code/rubik_mitm_solution.cpp. Each face has 5 cycles of 4 cells,
+# a clockwise quarter turn moves the color in cycle[i - 1] to cycle[i].
+MOVES = np.array(
+    [
+        [[11, 13, 33, 31], [12, 23, 32, 22], [5, 14, 42, 30], [6, 24, 41, 21], [7, 34, 40, 10]],  # face A
+        [[8, 10, 30, 28], [9, 21, 29, 20], [0, 11, 40, 39], [3, 22, 43, 27], [5, 31, 45, 19]],  # face B
+        [[0, 2, 7, 5], [1, 4, 6, 3], [19, 16, 13, 10], [18, 15, 12, 9], [17, 14, 11, 8]],  # face C
+        [[40, 42, 47, 45], [41, 44, 46, 43], [31, 34, 37, 28], [32, 35, 38, 29], [33, 36, 39, 30]],  # face D
+        [[14, 16, 36, 34], [15, 25, 35, 24], [7, 17, 47, 33], [4, 26, 44, 23], [2, 37, 42, 13]],  # face E
+        [[17, 19, 39, 37], [18, 27, 38, 26], [2, 8, 45, 36], [1, 20, 46, 25], [0, 28, 47, 16]],  # face F
+    ]
+)
+
+# Move m turns face m // 3 clockwise by m % 3 + 1 quarter turns. This is the
+# order in which explore_states tries the moves.
+MOVE_NAMES = [face + ending for face in FACES for ending in ["", "2", "'"]]
+MOVE_FACE = np.repeat(np.arange(6), 3)
+MOVE_TURNS = np.tile(np.arange(1, 4), 6)
+INVERSE_MOVE = np.array([3 * (m // 3) + 2 - m % 3 for m in range(18)])
+
+# The scramble of Feliks Zemdegs' 4.73 s world record (2016), the default of
+# the solver CLIs and, as util.FELIKS_SCRAMBLE_MOVES, of the scenes.
+# https://ruwix.com/blog/feliks-zemdegs-rubiks-world-record-2016-4-73/
+FELIKS_SCRAMBLE = "U2 F L2 U2 R2 F L2 F2 L' D' B2 R D2 R' B' U' L' B'"
+
+
+def _quarter_turn(face):
+    perm = np.arange(48)
+    for cycle in MOVES[face]:
+        perm[cycle] = np.roll(cycle, 1)
+    return perm
+
+
+def compose(*perms):
+    """
+    Combine gather permutations so that states[:, compose(p, q)] is the same
+    as states[:, p][:, q], i.e. p is applied first.
+    """
+    res = np.arange(48)
+    for perm in perms:
+        res = res[perm]
+    return res
+
+
+# MOVE_PERMS[m] is the gather permutation of move m: the cell i of the new
+# state takes the color of cell MOVE_PERMS[m][i] of the old one.
+MOVE_PERMS = np.array(
+    [compose(*[_quarter_turn(face)] * turns) for face, turns in zip(MOVE_FACE, MOVE_TURNS)]
+)
+MOVE_PERMS.flags.writeable = False
+
+
+def move_index(move):
+    """Turn a move name like "U", "U2" or "U'" into its index in MOVE_NAMES."""
+    if isinstance(move, (int, np.integer)):
+        return int(move)
+    return MOVE_NAMES.index(move)
+
+
+def solved(n=1):
+    """A batch of n solved cubes."""
+    return np.tile(SOLVED, (n, 1))
+
+
+def apply_move(states, move):
+    """Apply one move to a single state or a batch of states."""
+    return states[..., MOVE_PERMS[move_index(move)]]
+
+
+def apply_moves(states, moves):
+    """Apply a sequence of moves (names or indices) one after another."""
+    perm = compose(*[MOVE_PERMS[move_index(move)] for move in moves])
+    return states[..., perm]
+
+
+def expand(states, moves=None):
+    """
+    Apply every move (or each of the given moves) to every state.
+
+    Returns an array of shape (N * len(moves), 48) where the successor of
+    states[i] by moves[j] is at row i * len(moves) + j.
+    """
+    perms = MOVE_PERMS if moves is None else MOVE_PERMS[[move_index(m) for m in moves]]
+    states = np.asarray(states, dtype=np.uint8).reshape(-1, 48)
+    return states[:, perms].reshape(-1, 48)
+
+
+def from_string(s):
+    """Parse a 48 character 'A'..'F' string as printed by the C++ programs."""
+    states = np.frombuffer(s.encode("ascii"), dtype=np.uint8) - ord("A")
+    assert states.shape == (48,) and states.max() < 6, f"Not a cube state: {s!r}"
+    return states
+
+
+def to_string(state):
+    return (np.asarray(state, dtype=np.uint8) + ord("A")).tobytes().decode("ascii")
+
+
+def is_solved(states):
+    return (np.asarray(states).reshape(-1, 48) == SOLVED).all(axis=1)
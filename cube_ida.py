@@ -0,0 +1,146 @@
+"""
+Optimal solver using IDA*, an alternative to cube_mitm that needs 86 MB of
+pattern databases (see cube_pdb) instead of a ball of states.
+
+The search goes depth first through the canonical move sequences (the same
+face ordering rule as explore_states in code/*.cpp, see cube_sequences) and
+drops a sequence as soon as moves made + a lower bound of the moves left
+exceed the current bound. The lower bound is the largest distance of the
+corners, the edges UR..DF and the edges DL..BR from their pattern databases.
+Bounds are tried from the lower bound of the scramble upwards, each one
+being the smallest value that exceeded the one before, so the first
+solution found is optimal.
+
+A cube is carried as its three pattern states, which together determine it:
+it is solved exactly when all three are. Instead of one node at a time,
+the search expands batches of nodes of the same depth with numpy and keeps
+a stack of batches, so memory stays at a few batches per level.
+
+    python cube_ida.py --pdb-dir DIR "R U R' U'"
+"""
+import argparse
+import time
+
+import numpy as np
+
+import cube_coords
+import cube_engine
+import cube_pdb
+import cube_sequences
+import cube_telemetry
+
+
+def lower_bound(indices, databases):
+    """The largest distance of the pattern states of a batch of cubes."""
+    return np.max([db[index] for db, index in zip(databases, indices)], axis=0)
+
+
+def _search(indices, databases, bound, batch_size, stats, telemetry=None):
+    # One iteration: a solution with at most `bound` moves, or None. Sets
+    # stats["next_bound"] to the smallest f = g + h above the bound that was
+    # seen, which is never more than the next f that matters.
+    stack = [(indices, np.array([-1]), np.empty((1, 0), dtype=np.int8))]
+
+    while stack:
+        indices, last_face, path = stack.pop()
+        g = path.shape[1]
+
+        # The lookups are random memory accesses and cost most of the time,
+        # so every database only sees the moves that the ones before kept.
+        allowed = cube_sequences.ALLOWED[last_face + 1][:, cube_engine.MOVE_FACE]
+        rows, moves = np.nonzero(allowed)
+        succ = []
+        f = np.full(len(rows), g + 1, dtype=np.int64)
+        for db, index in zip(databases, indices):
+            succ.append(db.move(index[rows], moves))
+            f = np.maximum(f, g + 1 + db[succ[-1]])
+            keep = f <= bound
+            if not keep.all():
+                stats["next_bound"] = min(stats["next_bound"], int(f[~keep].min()))
+                rows, moves, f = rows[keep], moves[keep], f[keep]
+                succ = [s[keep] for s in succ]
+
+        stats["nodes"] += len(rows)
+        if telemetry is not None:
+            telemetry.update(stats["nodes"])
+        path = np.concatenate([path[rows], moves[:, None].astype(np.int8)], axis=1)
+
+        # A distance of 0 in all databases is the solved cube.
+        solved = np.flatnonzero(f == g + 1)
+        if len(solved):
+            return path[solved[0]].tolist()
+
+        # Pushed in reverse, so that sequences come off the stack in order.
+        for begin in reversed(range(0, len(rows), batch_size)):
+            end = begin + batch_size
+            stack.append(
+                ([s[begin:end] for s in succ], moves[begin:end] // 3, path[begin:end])
+            )
+    return None
+
+
+def solve(state, databases, max_length=20, batch_size=1 << 14, verbose=False, telemetry=None):
+    """
+    An optimal solution (list of move names) of the state, None if there is
+    none with at most max_length moves. `telemetry` gets a phase per bound,
+    whose number of nodes is not known in advance.
+    """
+    cube_pdb.prepare_move_tables()
+    coords = cube_coords.from_stickers(state)
+    indices = [db.index_of(coords) for db in databases]
+    bound = int(lower_bound(indices, databases)[0])
+    if bound == 0:
+        return []
+
+    while bound <= max_length:
+        stats = {"nodes": 0, "next_bound": max_length + 1}
+        start_time = time.time()
+        if telemetry is not None:
+            telemetry.begin("ida", bound, unit="nodes")
+        solution = _search(indices, databases, bound, batch_size, stats, telemetry)
+        if telemetry is not None:
+            telemetry.end(stats["nodes"], solved=solution is not None)
+
+        if verbose:
+            elapsed = time.time() - start_time
+            print(
+                f"bound {bound:2d}: {stats['nodes']:>16,d} nodes, {elapsed:8.2f} s, "
+                f"{stats['nodes'] / max(elapsed, 1e-9):>12,.0f} nodes/s"
+            )
+        if solution is not None:
+            return [cube_engine.MOVE_NAMES[m] for m in solution]
+        bound = stats["next_bound"]
+    return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Find an optimal solution of a scramble with IDA*.")
+    parser.add_argument(
+        "scrambles", nargs="*", default=[cube_engine.FELIKS_SCRAMBLE], help="scrambles like \"U2 F L2\""
+    )
+    parser.add_argument("--pdb-dir", default=".", help="pattern databases, built if missing")
+    parser.add_argument("--max-length", type=int, default=20)
+    parser.add_argument("--batch-size", type=int, default=1 << 14)
+    parser.add_argument("--telemetry", help="append JSON lines of the progress to this file")
+    parser.add_argument("--progress", action="store_true", help="show the progress with tqdm")
+    args = parser.parse_args()
+
+    start_time = time.time()
+    databases = cube_pdb.open_databases(args.pdb_dir, verbose=True)
+    print(f"pattern databases ready in {time.time() - start_time:.2f} s")
+
+    with cube_telemetry.Telemetry(args.telemetry, progress=args.progress) as telemetry:
+        for scramble in args.scrambles:
+            state = cube_engine.apply_moves(cube_engine.SOLVED, scramble.split())
+            start_time = time.time()
+            solution = solve(
+                state, databases, args.max_length, args.batch_size, verbose=True, telemetry=telemetry
+            )
+            if solution is None:
+                print(f"{scramble}: no solution with at most {args.max_length} moves")
+            else:
+                assert cube_engine.is_solved(cube_engine.apply_moves(state, solution))[0]
+                print(
+                    f"{scramble}: optimal solution, {len(solution)} moves: {' '.join(solution)} "
+                    f"({time.time() - start_time:.2f} s)"
+                )
@@ -0,0 +1,290 @@
+"""
+The solved side of meet in the middle: all states within `radius` moves of
+solved, with their distance.
+
+A Ball keeps them as the sorted levels of cube_bfs, in memory or mapped
+from a cube_bfs work directory.
+
+The C++ solver rebuilds its table of the solved side before every run. A
+StateIndex is built once, from the levels of a Ball, and saved as one file:
+
+    header    512 bytes, see HEADER_DTYPE
+    keys      count packed keys (cube_keys), sorted
+    depth     count uint8, the distance of every key from solved
+    moves     count uint8, a move that takes the state one step closer to
+              solved in the low 5 bits, NO_MOVE for solved (from version
+              2, not in symmetric indices)
+
+With the moves, a state of the index is solved in `depth` lookups, which
+is how the solver turns a state in the middle into a full solution.
+
+A symmetric ball or index (FLAG_SYMMETRIC, from version 3) only has the
+canonical keys of cube_symmetry, one per class of states that are symmetric
+to each other or inverses, with up to 96 times fewer keys. Lookups then
+canonicalize the states first, which costs far more than packing them.
+
+Opening it only maps the file into memory, so a new solver process is ready
+in milliseconds, and processes that use the same index share it through the
+OS page cache. Lookups are a binary search over the mapped keys.
+
+    python cube_index.py build index_8.bin --radius 8 --work-dir DIR
+    python cube_mitm.py --index index_8.bin --processes 64
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+
+import cube_bfs
+import cube_engine
+import cube_keys
+import cube_symmetry
+
+MAGIC = b"CUBEIDX"
+VERSION = 3
+NO_MOVE = 31
+FLAG_SYMMETRIC = 1
+HEADER_SIZE = 512
+HEADER_DTYPE = np.dtype(
+    [
+        ("magic", "S8"),
+        ("version", "<u4"),
+        ("radius", "<u4"),
+        ("count", "<u8"),
+        ("level_counts", "<u8", (32,)),
+        ("flags", "<u4"),
+    ]
+)
+
+
+class Ball:
+    """
+    The states within `radius` moves of solved, as one sorted key array per
+    distance. The arrays may be memory-mapped level files of cube_bfs.
+    With symmetric, they only have the representatives of cube_bfs.
+    """
+
+    def __init__(self, levels, symmetric=False):
+        self.levels = levels
+        self.radius = len(levels) - 1
+        self.symmetric = symmetric
+
+    @classmethod
+    def build(cls, radius, work_dir=None, symmetric=False):
+        if work_dir is None:
+            levels = [level for _, level in cube_bfs.bfs_levels(radius, symmetric=symmetric)]
+            return cls(levels, symmetric)
+
+        for _ in cube_bfs.external_level_sizes(radius, work_dir, symmetric=symmetric):
+            pass
+        levels = [
+            cube_bfs.open_keys(cube_bfs.level_path(work_dir, d, symmetric)) for d in range(radius + 1)
+        ]
+        return cls(levels, symmetric)
+
+    def __len__(self):
+        return sum(len(level) for level in self.levels)
+
+    def depth_of_keys(self, keys):
+        """The distance from solved of every key, -1 if it is not in the ball."""
+        res = np.full(len(keys), -1, dtype=np.int8)
+        for depth, level in enumerate(self.levels):
+            res[cube_keys.contains(level, keys)] = depth
+        return res
+
+    def depth_of(self, states):
+        if self.symmetric:
+            return self.depth_of_keys(cube_symmetry.canonical_keys(states))
+        return self.depth_of_keys(cube_keys.pack(states))
+
+    def path_to_solved(self, state):
+        """Move indices that solve a state of the ball, by stepping one level down at a time."""
+        depth = self.depth_of(state)[0]
+        assert depth >= 0, "The state is not in the ball"
+
+        moves = []
+        while depth > 0:
+            succ = cube_engine.expand(state)
+            move = int(np.flatnonzero(self.depth_of(succ) == depth - 1)[0])
+            moves.append(move)
+            state = succ[move]
+            depth -= 1
+        return moves
+
+
+def _moves_to_previous(keys, previous):
+    # For every key of a level, the first move that leads to the level before.
+    if len(keys) == 0:
+        return np.empty(0, dtype=np.uint8)
+    found = cube_keys.contains(previous, cube_bfs.expand_keys(keys)).reshape(-1, 18)
+    assert found.any(axis=1).all(), "The levels are not consecutive BFS levels"
+    return np.argmax(found, axis=1).astype(np.uint8)
+
+
+def _merge_levels(levels, block_size, with_moves=True):
+    # Like cube_bfs._merge_runs, but the levels are disjoint and we keep track
+    # of which level every key comes from, and of the way back to solved
+    # (None without with_moves).
+    positions = [0] * len(levels)
+
+    while True:
+        active = [d for d, level in enumerate(levels) if positions[d] < len(level)]
+        if not active:
+            return
+
+        blocks = {d: np.asarray(levels[d][positions[d]:positions[d] + block_size]) for d in active}
+        bound = np.sort(np.concatenate([cube_keys.as_void(blocks[d][-1:]) for d in active]))[:1]
+
+        keys = []
+        depth = []
+        moves = []
+        for d in active:
+            n = np.searchsorted(cube_keys.as_void(blocks[d]), bound, side="right")[0]
+            keys.append(blocks[d][:n])
+            depth.append(np.full(n, d, dtype=np.uint8))
+            if with_moves and d == 0:
+                moves.append(np.full(n, NO_MOVE, dtype=np.uint8))
+            elif with_moves:
+                moves.append(_moves_to_previous(keys[-1], levels[d - 1]))
+            positions[d] += n
+
+        keys = np.concatenate(keys)
+        order = np.argsort(cube_keys.as_void(keys))
+        moves = np.concatenate(moves)[order] if with_moves else None
+        yield keys[order], np.concatenate(depth)[order], moves
+
+
+def _map_sections(path, count, mode, moves=True):
+    # The keys, depth and (if the index has them) moves sections of an index file.
+    if count == 0:
+        sections = [np.empty(0, dtype=cube_keys.KEY_DTYPE), np.empty(0, dtype=np.uint8)]
+        return sections + [np.empty(0, dtype=np.uint8)] * moves
+
+    sections = [
+        np.memmap(path, dtype=cube_keys.KEY_DTYPE, mode=mode, offset=HEADER_SIZE, shape=(count,)),
+        np.memmap(path, dtype=np.uint8, mode=mode, offset=HEADER_SIZE + 16 * count, shape=(count,)),
+    ]
+    if moves:
+        offset = HEADER_SIZE + 17 * count
+        sections.append(np.memmap(path, dtype=np.uint8, mode=mode, offset=offset, shape=(count,)))
+    return sections
+
+
+def write_index(path, levels, block_size=1 << 22, symmetric=False):
+    """
+    Write the index of the given sorted, disjoint levels (level d = distance
+    d), which only have representatives (see cube_bfs) with symmetric.
+    """
+    count = sum(len(level) for level in levels)
+    assert len(levels) <= HEADER_DTYPE["level_counts"].shape[0]
+
+    header = np.zeros(1, dtype=HEADER_DTYPE)
+    header["magic"] = MAGIC
+    header["version"] = VERSION
+    header["radius"] = len(levels) - 1
+    header["count"] = count
+    header["level_counts"][0, :len(levels)] = [len(level) for level in levels]
+    header["flags"] = FLAG_SYMMETRIC if symmetric else 0
+
+    with open(path + ".tmp", "wb") as f:
+        f.write(header.tobytes().ljust(HEADER_SIZE, b"\0"))
+        f.truncate(HEADER_SIZE + (17 if symmetric else 18) * count)
+
+    sections = _map_sections(path + ".tmp", count, "r+", moves=not symmetric)
+
+    done = 0
+    for block in _merge_levels(levels, block_size, with_moves=not symmetric):
+        for section, values in zip(sections, block):
+            section[done:done + len(values)] = values
+        done += len(block[0])
+
+    for section in sections:
+        if isinstance(section, np.memmap):
+            section.flush()
+    del sections
+    os.replace(path + ".tmp", path)
+
+
+def build_index(path, radius, work_dir=None, symmetric=False):
+    """Run the BFS from solved up to radius (on disk if work_dir is given) and index it."""
+    write_index(path, Ball.build(radius, work_dir, symmetric).levels, symmetric=symmetric)
+
+
+class StateIndex(Ball):
+    """
+    A memory-mapped index file. It can be used everywhere a Ball can, with
+    one binary search per lookup instead of one per level.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.header = np.fromfile(path, dtype=HEADER_DTYPE, count=1)[0]
+        assert self.header["magic"] == MAGIC, f"{path} is not a cube state index"
+        version = int(self.header["version"])
+        assert 1 <= version <= VERSION, f"Unknown index version {version}"
+
+        self.radius = int(self.header["radius"])
+        count = int(self.header["count"])
+        self.level_counts = self.header["level_counts"][:self.radius + 1].tolist()
+        flags = int(self.header["flags"]) if version >= 3 else 0
+        self.symmetric = bool(flags & FLAG_SYMMETRIC)
+
+        # Indices of version 1 and symmetric ones have no moves,
+        # path_to_solved then searches.
+        has_moves = version >= 2 and not self.symmetric
+        self.keys, self.depth, self.moves = (_map_sections(path, count, "r", has_moves) + [None])[:3]
+
+    def __len__(self):
+        return len(self.keys)
+
+    def depth_of_keys(self, keys):
+        pos = cube_keys.search(self.keys, keys)
+        return np.where(pos >= 0, self.depth[np.maximum(pos, 0)], -1).astype(np.int8)
+
+    def path_to_solved(self, state):
+        if self.moves is None:
+            return super().path_to_solved(state)
+
+        moves = []
+        while True:
+            pos = cube_keys.search(self.keys, cube_keys.pack(state))[0]
+            assert pos >= 0, "The state is not in the index"
+            move = int(self.moves[pos]) & 0x1F
+            if move == NO_MOVE:
+                return moves
+            moves.append(move)
+            state = cube_engine.apply_move(state, move)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build or inspect a solved-side state index.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = subparsers.add_parser("build")
+    build_parser.add_argument("path")
+    build_parser.add_argument("--radius", type=int, required=True)
+    build_parser.add_argument("--work-dir", help="run the BFS on disk in this directory")
+    build_parser.add_argument(
+        "--symmetric", action="store_true", help="only keep one state per class of symmetric states"
+    )
+
+    info_parser = subparsers.add_parser("info")
+    info_parser.add_argument("path")
+
+    args = parser.parse_args()
+
+    if args.command == "build":
+        start_time = time.time()
+        build_index(args.path, args.radius, args.work_dir, args.symmetric)
+        print(f"built {args.path} in {time.time() - start_time:.2f} s")
+
+    start_time = time.time()
+    index = StateIndex(args.path)
+    print(f"opened {args.path} in {1000 * (time.time() - start_time):.2f} ms")
+    print(
+        f"radius {index.radius}, {len(index):,d} {'classes' if index.symmetric else 'states'}, "
+        f"{os.path.getsize(args.path):,d} bytes"
+    )
+    for depth, count in enumerate(index.level_counts):
+        print(f"depth {depth:2d}: {count:>13,d}")
@@ -0,0 +1,222 @@
+"""
+Reading scrambles in bulk: files with one scramble per line, either a move
+sequence like "U2 F L2 U2" or a 48 character 'A'..'F' state as printed by
+the C++ programs (see cube_engine.from_string). Empty lines and lines
+starting with # are skipped.
+
+The lines are read chunk_size at a time, so memory stays bounded however
+long the file is. The move sequences of a chunk are tokenized as one byte
+array and turned into one permutation of the cells each, with one gather
+per two move positions for the whole chunk (from a table of all pairs of
+moves). The states of a chunk are parsed with one numpy call.
+Sticker states can be anything, so they are checked in batch:
+
+    characters   only 'A'..'F'
+    colors       every color exactly 8 times
+    cubies       the colors of every corner and edge form a real cubie, and
+                 every cubie is there once
+    twist        the corner twists sum to 0 mod 3
+    flip         the edge flips sum to 0 mod 2
+    parity       the corner and edge permutations have the same parity
+
+which together are exactly the states that can be solved.
+
+    python cube_ingest.py scrambles.txt --output states.bin
+"""
+import argparse
+import functools
+import itertools
+import time
+
+import numpy as np
+
+import cube_coords
+import cube_engine
+
+# Why a scramble is rejected, the first failing check of the module docstring.
+REASONS = ["ok", "moves", "characters", "colors", "cubies", "twist", "flip", "parity"]
+
+# Bytes of move sequences: faces, the endings "2" and "'" (see
+# cube_engine.MOVE_NAMES) and separators.
+_FACE_CODE = np.full(256, -1, dtype=np.int64)
+_FACE_CODE[np.frombuffer(cube_engine.FACES.encode("ascii"), dtype=np.uint8)] = np.arange(6)
+_TURN_CODE = np.full(256, -1, dtype=np.int64)
+_TURN_CODE[[ord("2"), ord("'")]] = [1, 2]
+_SEPARATOR = np.zeros(256, dtype=bool)
+_SEPARATOR[[ord(" "), ord("\t"), ord("\n")]] = True
+
+_IDENTITY_MOVE = 18
+
+
+@functools.lru_cache(maxsize=None)
+def _pair_perms():
+    # The permutations of all pairs of moves, 19 * 19 x 48 with the identity
+    # as move 18, so that a sequence takes one gather per two moves.
+    perms = np.concatenate([cube_engine.MOVE_PERMS, np.arange(48)[None]])
+    pairs = perms[:, perms].reshape(19 * 19, 48).astype(np.int32)
+    pairs.flags.writeable = False
+    return pairs
+
+
+def _tokenize(lines):
+    # The move indices of every line, padded with _IDENTITY_MOVE, and which
+    # lines are not sequences of whitespace separated move names.
+    data = np.frombuffer(("\n".join(lines) + "\n").encode("ascii", "replace"), dtype=np.uint8)
+    newline = data == ord("\n")
+    line_of = np.cumsum(newline) - newline
+    face = _FACE_CODE[data]
+    turn = _TURN_CODE[data]
+    separator = _SEPARATOR[data]
+    next_face = np.append(face[1:], -1)
+    next_separator = np.append(separator[1:], True)
+    previous_face = np.insert(face[:-1], 0, -1)
+
+    bad = (face < 0) & (turn < 0) & ~separator
+    bad |= (turn >= 0) & ((previous_face < 0) | ~next_separator)
+    bad |= (face >= 0) & (next_face >= 0)
+    bad_lines = np.zeros(len(lines), dtype=bool)
+    bad_lines[line_of[bad]] = True
+
+    positions = np.flatnonzero(face >= 0)
+    ids = line_of[positions]
+    counts = np.bincount(ids, minlength=len(lines))
+    columns = np.arange(len(positions)) - (np.cumsum(counts) - counts)[ids]
+    moves = np.full((len(lines), counts.max(initial=0)), _IDENTITY_MOVE, dtype=np.int64)
+    moves[ids, columns] = 3 * face[positions] + np.maximum(turn[positions + 1], 0)
+    return moves, bad_lines
+
+
+def compile_moves(lines):
+    """
+    The permutations of the cells (as in cube_engine.compose) of a batch of
+    move sequences, and the REASONS index of every line: 0, or 1 ("moves")
+    for lines that are not move sequences, whose permutation is the identity.
+    """
+    moves, bad = _tokenize(lines)
+    moves[bad] = _IDENTITY_MOVE
+    if moves.shape[1] % 2:
+        moves = np.concatenate([moves, np.full((len(moves), 1), _IDENTITY_MOVE)], axis=1)
+    pairs = moves[:, 0::2] * 19 + moves[:, 1::2]
+
+    perms = np.tile(np.arange(48, dtype=np.uint8), (len(lines), 1))
+    offsets = (48 * np.arange(len(lines), dtype=np.int32))[:, None]
+    for i in range(pairs.shape[1]):
+        perms = perms.ravel()[_pair_perms()[pairs[:, i]] + offsets]
+    return perms, np.where(bad, REASONS.index("moves"), 0)
+
+
+def parse_states(lines):
+    """
+    The states of a batch of 48 character lines, and the REASONS index of
+    every line (see check_states).
+    """
+    data = np.frombuffer("".join(lines).encode("ascii", "replace"), dtype=np.uint8)
+    states = data.reshape(-1, 48) - np.uint8(ord("A"))
+    bad = (states >= 6).any(axis=1)
+    states[bad] = cube_engine.SOLVED
+    reasons = check_states(states)
+    return states, np.where(bad, REASONS.index("characters"), reasons)
+
+
+def check_states(states):
+    """The REASONS index of every state of a batch, 0 for the solvable ones."""
+    states = np.asarray(states, dtype=np.uint8).reshape(-1, 48)
+    reasons = np.zeros(len(states), dtype=np.int64)
+
+    def fail(reason, failed):
+        reasons[(reasons == 0) & failed] = REASONS.index(reason)
+
+    counts = (states[:, :, None] == np.arange(6)).sum(axis=1)
+    fail("colors", (counts != 8).any(axis=1))
+
+    cp, co, ep, eo = cube_coords.stickers_to_cubies(states)
+    complete = (np.sort(cp, axis=1) == np.arange(8)).all(axis=1)
+    complete &= (np.sort(ep, axis=1) == np.arange(12)).all(axis=1)
+    fail("cubies", ~complete)
+    fail("twist", co.sum(axis=1) % 3 != 0)
+    fail("flip", eo.sum(axis=1) % 2 != 0)
+    parity = cube_coords.permutation_parity
+    fail("parity", parity(cp) != parity(ep))
+    return reasons
+
+
+def _is_state(line):
+    return len(line) == 48 and " " not in line
+
+
+def parse_lines(lines):
+    """
+    The states of a batch of lines in either format and the REASONS index of
+    every line, which is 0 for the states that can be solved.
+    """
+    states = np.empty((len(lines), 48), dtype=np.uint8)
+    reasons = np.empty(len(lines), dtype=np.int64)
+    is_state = np.array([_is_state(line) for line in lines], dtype=bool)
+
+    rows = np.flatnonzero(is_state)
+    if len(rows):
+        states[rows], reasons[rows] = parse_states([lines[i] for i in rows])
+    rows = np.flatnonzero(~is_state)
+    if len(rows):
+        perms, reasons[rows] = compile_moves([lines[i] for i in rows])
+        states[rows] = cube_engine.SOLVED[perms]
+    return states, reasons
+
+
+def read_scrambles(f, chunk_size=1 << 16, errors=None):
+    """
+    Yield (line numbers, states) of the scrambles in a file (or any iterable
+    of lines) that can be solved, chunk_size lines at a time. Rejected lines
+    are appended to `errors` as (line number, reason), if given.
+    """
+    stripped = (line.strip() for line in f)
+    numbered = (
+        (number, line)
+        for number, line in enumerate(stripped, start=1)
+        if line and not line.startswith("#")
+    )
+    while True:
+        chunk = list(itertools.islice(numbered, chunk_size))
+        if not chunk:
+            return
+        numbers = np.array([number for number, _ in chunk], dtype=np.int64)
+        states, reasons = parse_lines([line for _, line in chunk])
+
+        if errors is not None:
+            for i in np.flatnonzero(reasons):
+                errors.append((int(numbers[i]), REASONS[reasons[i]]))
+        ok = reasons == 0
+        yield numbers[ok], states[ok]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Parse and check a file of scrambles.")
+    parser.add_argument("path")
+    parser.add_argument("--chunk-size", type=int, default=1 << 16)
+    parser.add_argument("--output", help="write the valid states here, 48 bytes each")
+    args = parser.parse_args()
+
+    start_time = time.time()
+    errors = []
+    count = 0
+    out = open(args.output, "wb") if args.output else None
+    try:
+        with open(args.path) as f:
+            for numbers, states in read_scrambles(f, args.chunk_size, errors):
+                count += len(states)
+                if out:
+                    states.tofile(out)
+    finally:
+        if out:
+            out.close()
+
+    elapsed = time.time() - start_time
+    total = count + len(errors)
+    print(f"{total:,d} scrambles in {elapsed:.2f} s, {total / max(elapsed, 1e-9):,.0f} per second")
+    print(f"{count:,d} valid")
+    rejected = np.bincount([REASONS.index(reason) for _, reason in errors], minlength=len(REASONS))
+    for reason, n in zip(REASONS, rejected):
+        if n:
+            print(f"{n:,d} rejected: {reason}")
+    for number, reason in errors[:10]:
+        print(f"  line {number}: {reason}")
@@ -273,17 +273,28 @@ class FeliksVsOptimal(util.RubikScene):
         self.add(cube_best, cube_actual)
         self.wait()
 
-        for i, (move_actual, move_best) in enumerate(
+        # Moves that cancel out are not animated, a merged move is done at
+        # the last of the moves it stands for. The counter still counts all.
+        simplified_at = {
+            origins[-1]: move
+            for move, origins in zip(
+                util.FELIKS_ACTUAL_SOLUTION_SIMPLIFIED, util.FELIKS_ACTUAL_SOLUTION_ORIGINS
+            )
+        }
+        for i, (_, move_best) in enumerate(
             itertools.zip_longest(
                 util.FELIKS_ACTUAL_SOLUTION_MOVES, util.FELIKS_UNSCRAMBLE_MOVES
             )
         ):
-            anims_cur = [cube_actual.animate.do_move(move_actual)]
+            anims_cur = []
+            if i in simplified_at:
+                anims_cur += [cube_actual.animate.do_move(simplified_at[i])]
             if move_best is not None:
                 anims_cur += [cube_best.animate.do_move(move_best)]
-            
-            self.play_cube_sound()
-            self.play(*anims_cur, run_time=(10 / (15 + i)))
+
+            if anims_cur:
+                self.play_cube_sound()
+                self.play(*anims_cur, run_time=(10 / (15 + i)))
 
             counter_actual.set_value(i + 1).set_color(GRAY)
             if move_best is not None:
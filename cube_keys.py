@@ -0,0 +1,105 @@
+"""
+Packed 128-bit state keys, a vectorized port of compress_state from
+code/rubik_mitm_solution.cpp.
+
+A key is the pair (hi, lo) where hi holds cells 0..23 and lo cells 24..47 as
+base-6 numbers, exactly like the C++ pair<ull, ull>. Both halves are stored
+big-endian, so the raw 16 bytes of a key compare the same way as the pair
+(hi, lo). Sorting, deduplication and lookups therefore run on a "V16" view
+with plain memcmp instead of numpy's slow generic structured comparison.
+"""
+import numpy as np
+
+import cube_engine
+
+KEY_DTYPE = np.dtype([("hi", ">u8"), ("lo", ">u8")])
+
+_POWERS = 6 ** np.arange(23, -1, -1, dtype=np.uint64)
+
+
+def pack(states):
+    """Pack an N x 48 batch of states into N keys."""
+    states = np.asarray(states, dtype=np.uint8).reshape(-1, 2, 24)
+    halves = states.astype(np.uint64) @ _POWERS
+    keys = np.empty(len(states), dtype=KEY_DTYPE)
+    keys["hi"] = halves[:, 0]
+    keys["lo"] = halves[:, 1]
+    return keys
+
+
+def unpack(keys):
+    """Inverse of pack, returns an N x 48 uint8 array."""
+    keys = np.asarray(keys, dtype=KEY_DTYPE).reshape(-1)
+    states = np.empty((len(keys), 48), dtype=np.uint8)
+    for offset, field in [(0, "hi"), (24, "lo")]:
+        rest = keys[field].astype(np.uint64)
+        for i in range(23, -1, -1):
+            rest, states[:, offset + i] = np.divmod(rest, np.uint64(6))
+    return states
+
+
+SOLVED_KEY = pack(cube_engine.SOLVED)[0]
+
+
+def as_void(keys):
+    """View keys as opaque 16-byte items that sort in (hi, lo) order."""
+    return np.ascontiguousarray(keys, dtype=KEY_DTYPE).view("V16")
+
+
+def sort(keys):
+    return np.sort(as_void(keys)).view(KEY_DTYPE)
+
+
+def unique(keys, return_index=False):
+    """
+    Sorted unique keys. With return_index, also the index of the first
+    occurrence of every unique key, like np.unique.
+    """
+    res = np.unique(as_void(keys), return_index=return_index)
+    if return_index:
+        return res[0].view(KEY_DTYPE), res[1]
+    return res.view(KEY_DTYPE)
+
+
+def search(table, queries):
+    """
+    Positions of the queries in a sorted key table, -1 where missing.
+
+    The queries are looked up in the order of their high halves (a cheap
+    uint64 argsort), so that the binary searches sweep through the table
+    from start to end instead of jumping around a table that may be much
+    larger than the caches or even memory-mapped from disk.
+    """
+    table = as_void(table)
+    queries = np.ascontiguousarray(queries, dtype=KEY_DTYPE)
+    if len(table) == 0:
+        return np.full(len(queries), -1, dtype=np.int64)
+
+    order = np.argsort(queries["hi"].astype(np.uint64))
+    ordered = queries.view("V16")[order]
+    pos = np.empty(len(queries), dtype=np.int64)
+    pos[order] = np.searchsorted(table, ordered)
+    pos[pos == len(table)] = 0
+    return np.where(table[pos] == queries.view("V16"), pos, -1)
+
+
+def contains(table, queries):
+    """Membership mask of the queries in a sorted key table."""
+    return search(table, queries) >= 0
+
+
+def difference(keys, *tables):
+    """Sorted unique keys that are in none of the given sorted tables."""
+    keys = unique(keys)
+    for table in tables:
+        keys = keys[~contains(table, keys)]
+    return keys
+
+
+def map_bytes(path, writable=False):
+    """
+    Memory-map a file as uint8, returns a plain array view of the mapping
+    (a np.memmap slows down every lookup) and the mapping, for flush().
+    """
+    mapping = np.memmap(path, dtype=np.uint8, mode="r+" if writable else "r")
+    return mapping.view(np.ndarray), mapping
@@ -0,0 +1,199 @@
+"""
+Optimal solver using meet in the middle, a Python version of
+code/rubik_mitm_solution.cpp that returns the whole solution.
+
+First we find all states within `radius` moves of the solved cube (the
+ball). Then we try all canonical move sequences of length 0, 1, 2, ... from
+the scrambled cube and look the states they reach up in the ball. The first
+length j with a hit gives an optimal solution of j + (depth of the hit)
+moves: an optimal solution of D moves passes through a state j = D - radius
+moves away from the scramble that is radius moves away from solved.
+
+The sequences of one length are split into slices by their rank (see
+cube_sequences) and checked in parallel by forked worker processes that
+share the ball. solve_many() searches from many scrambles in lockstep, so
+every sequence is composed only once and all the states it leads to are
+looked up together. Confirming the 18 move solution of Feliks takes radius 8
+and sequences of length 10 on the scramble side:
+
+    python cube_mitm.py --radius 8 --work-dir DIR --processes 64
+
+or, with an index built once by cube_index:
+
+    python cube_mitm.py --index index_8.bin --processes 64
+"""
+import argparse
+import multiprocessing
+import time
+
+import numpy as np
+
+import cube_engine
+import cube_index
+import cube_sequences
+import cube_telemetry
+
+
+# The ball used by the worker processes, inherited from the parent by fork.
+_BALL = None
+
+
+def _check_slice(states, length, start, stop, batch_size):
+    # Hits (scramble, rank of the prefix, last move, depth of the hit) among
+    # the canonical sequences of the given length from each of the states,
+    # whose first length - 1 moves have a rank in start..stop - 1.
+    #
+    # Every prefix is composed into one permutation of the 48 cells, followed
+    # by each of the 18 moves, and applied to all the states with one gather.
+    # All the resulting states are then looked up in the ball at once.
+    hits = []
+    identity = np.arange(48, dtype=np.uint8)
+    prefixes_per_batch = max(1, batch_size // (18 * len(states)))
+
+    for prefixes in cube_sequences.sequences(length - 1, start, stop, prefixes_per_batch):
+        last_face = prefixes[:, -1] // 3 if length > 1 else np.full(len(prefixes), -1)
+        allowed = cube_sequences.ALLOWED[last_face + 1][:, cube_engine.MOVE_FACE]
+
+        perms = cube_sequences.apply_sequences(identity, prefixes)[:, cube_engine.MOVE_PERMS]
+        succ = states[:, perms]
+        depth = _BALL.depth_of(succ).reshape(len(states), len(prefixes), 18)
+        depth[:, ~allowed] = -1
+
+        for scramble, row, move in zip(*np.nonzero(depth >= 0)):
+            hits.append((int(scramble), start + row, int(move), int(depth[scramble, row, move])))
+        start += len(prefixes)
+    return hits
+
+
+def _check_slice_star(args):
+    return _check_slice(*args)
+
+
+def solve_many(
+    states, ball, max_length=20, processes=1, batch_size=1 << 18, verbose=False, telemetry=None
+):
+    """
+    Optimal solutions (lists of move names, None where there is none with at
+    most max_length moves) of a batch of states.
+
+    The searches of all the states run in lockstep: the sequences of every
+    length are generated once for all states that are not solved yet, and
+    all the states they lead to are checked with one lookup per batch.
+    `telemetry` gets the states checked after every slice of sequences.
+    """
+    global _BALL
+    _BALL = ball
+    states = np.asarray(states, dtype=np.uint8).reshape(-1, 48)
+    solutions = [None] * len(states)
+
+    for i in np.flatnonzero(ball.depth_of(states) >= 0):
+        solutions[i] = [cube_engine.MOVE_NAMES[m] for m in ball.path_to_solved(states[i])]
+    active = np.array([i for i in range(len(states)) if solutions[i] is None], dtype=np.int64)
+
+    pool = multiprocessing.get_context("fork").Pool(processes) if processes > 1 else None
+    try:
+        for length in range(1, max_length - ball.radius + 1):
+            if len(active) == 0:
+                break
+
+            start_time = time.time()
+            slices = cube_sequences.partition(length - 1, 4 * processes)
+            tasks = [
+                (states[active], length, start, stop, batch_size)
+                for start, stop in slices
+                if start < stop
+            ]
+            results = pool.imap(_check_slice_star, tasks) if pool else map(_check_slice_star, tasks)
+
+            leaves = cube_sequences.count(length) * len(active)
+            # No later lengths in the ETA, any of them may be the last.
+            if telemetry is not None:
+                telemetry.begin("mitm", length, leaves)
+            best = {}
+            prefixes = 0
+            for (_, _, start, stop, _), result in zip(tasks, results):
+                for scramble, rank, move, depth in result:
+                    if scramble not in best or depth < best[scramble][2]:
+                        best[scramble] = (rank, move, depth)
+                prefixes += stop - start
+                if telemetry is not None:
+                    telemetry.update(leaves * prefixes // cube_sequences.count(length - 1))
+            if telemetry is not None:
+                telemetry.end(scrambles=len(active), solved=len(best))
+
+            if verbose:
+                elapsed = time.time() - start_time
+                print(
+                    f"length {length:2d}: {len(active):>6d} scrambles, {leaves:>16,d} states, "
+                    f"{len(best)} solved, {elapsed:8.2f} s, "
+                    f"{leaves / max(elapsed, 1e-9):>12,.0f} states/s"
+                )
+
+            for scramble, (rank, move, _) in best.items():
+                state = states[active[scramble]]
+                moves = cube_sequences.unrank(rank, length - 1) + [move]
+                moves += ball.path_to_solved(cube_engine.apply_moves(state, moves))
+                solutions[active[scramble]] = [cube_engine.MOVE_NAMES[m] for m in moves]
+
+            active = np.array([i for i in active if solutions[i] is None], dtype=np.int64)
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+
+    return solutions
+
+
+def solve(
+    state, ball, max_length=20, processes=1, batch_size=1 << 18, verbose=False, telemetry=None
+):
+    """
+    An optimal solution (list of move names) of the state, None if there is
+    none with at most max_length moves.
+    """
+    return solve_many(state, ball, max_length, processes, batch_size, verbose, telemetry)[0]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Find an optimal solution of a scramble.")
+    parser.add_argument(
+        "scrambles", nargs="*", default=[cube_engine.FELIKS_SCRAMBLE], help="scrambles like \"U2 F L2\""
+    )
+    parser.add_argument("--radius", type=int, default=6, help="depth of the solved-side ball")
+    parser.add_argument("--work-dir", help="build the ball in this directory (see cube_bfs)")
+    parser.add_argument("--index", help="use this prebuilt index instead (see cube_index)")
+    parser.add_argument(
+        "--symmetric",
+        action="store_true",
+        help="build a ball of only one state per class of symmetric states (see cube_symmetry)",
+    )
+    parser.add_argument("--max-length", type=int, default=20)
+    parser.add_argument("--processes", type=int, default=1)
+    parser.add_argument("--telemetry", help="append JSON lines of the progress to this file")
+    parser.add_argument("--progress", action="store_true", help="show the progress with tqdm")
+    args = parser.parse_args()
+
+    start_time = time.time()
+    if args.index:
+        ball = cube_index.StateIndex(args.index)
+    else:
+        ball = cube_index.Ball.build(args.radius, args.work_dir, args.symmetric)
+    print(
+        f"ball of radius {ball.radius}: {len(ball):,d} {'classes' if ball.symmetric else 'states'}, "
+        f"{time.time() - start_time:.2f} s"
+    )
+
+    scrambles = np.array(
+        [cube_engine.apply_moves(cube_engine.SOLVED, scramble.split()) for scramble in args.scrambles]
+    )
+    with cube_telemetry.Telemetry(args.telemetry, progress=args.progress) as telemetry:
+        solutions = solve_many(
+            scrambles, ball, args.max_length, args.processes, verbose=True, telemetry=telemetry
+        )
+
+    for scramble, state, solution in zip(args.scrambles, scrambles, solutions):
+        if solution is None:
+            print(f"{scramble}: no solution with at most {args.max_length} moves")
+        else:
+            assert cube_engine.is_solved(cube_engine.apply_moves(state, solution))[0]
+            print(f"{scramble}: optimal solution, {len(solution)} moves: {' '.join(solution)}")
@@ -0,0 +1,280 @@
+"""
+Pattern databases: the exact distance from solved of one part of the cube,
+for every state of that part. The cube is never closer to solved than any
+of its parts, so these are admissible heuristics for a search.
+
+The corner database covers the 8! * 3^7 = 88,179,840 states of the corners,
+numbered cp * 2187 + co (see cube_coords). The corners are always solved in
+at most 11 moves, so a distance fits in 4 bits and two of them are packed
+into a byte, the even state in the low nibble:
+
+    byte i = distance(2 i) | distance(2 i + 1) << 4
+
+That makes a raw file of 44,089,920 bytes. It is built once by a BFS over the
+coordinates (about 15 s), opening it only maps it into memory, and
+lookups are vectorized over batches of states.
+
+Two edge databases cover the positions and flips of the edges UR..DF and of
+the edges DL..BR, 12P6 * 2^6 = 42,577,920 states (21 MB) each.
+
+    python cube_pdb.py DIR
+"""
+import abc
+import argparse
+import functools
+import os
+import time
+
+import numpy as np
+
+import cube_coords
+import cube_keys
+
+UNKNOWN = 15
+
+
+def bfs_distances(size, start, neighbors, chunk_size=1 << 20, verbose=False):
+    """
+    The distance from `start` of all `size` states of a pattern as uint8,
+    UNKNOWN for states that cannot be reached. neighbors(indices) returns
+    the states reached by every move, one column per move (usually 18).
+
+    The first levels grow from the frontier. Once fewer states are left
+    than there are on the frontier, it is cheaper to go the other way and
+    check for every state that is left whether one of its neighbours is on
+    the frontier; every move can be undone, so that is the same thing.
+    """
+    dist = np.full(size, UNKNOWN, dtype=np.uint8)
+    dist[start] = 0
+    depth = 0
+    frontier_size = 1
+    remaining = size - 1
+
+    while frontier_size > 0 and remaining > 0:
+        assert depth + 1 < UNKNOWN, "Distances do not fit in 4 bits"
+        start_time = time.time()
+        forward = frontier_size <= remaining
+        candidates = np.flatnonzero(dist == (depth if forward else UNKNOWN))
+
+        for begin in range(0, len(candidates), chunk_size):
+            chunk = candidates[begin:begin + chunk_size]
+            succ = neighbors(chunk)
+            if forward:
+                succ = succ[dist[succ] == UNKNOWN]
+                dist[succ] = depth + 1
+            else:
+                dist[chunk[(dist[succ] == depth).any(axis=1)]] = depth + 1
+
+        depth += 1
+        frontier_size = np.count_nonzero(dist == depth)
+        remaining -= frontier_size
+        if verbose:
+            print(
+                f"depth {depth:2d}: {frontier_size:>12,d} states, "
+                f"{'forward' if forward else 'backward'}, {time.time() - start_time:6.2f} s"
+            )
+    return dist
+
+
+def pack_nibbles(values):
+    """Pack values < 16 two per byte, the even ones in the low nibble."""
+    values = np.asarray(values, dtype=np.uint8)
+    if len(values) % 2:
+        values = np.append(values, np.uint8(UNKNOWN))
+    return values[0::2] | (values[1::2] << 4)
+
+
+def unpack_nibbles(table, index):
+    """The values with the given indices in a table of pack_nibbles."""
+    index = np.asarray(index, dtype=np.int64)
+    shift = ((index & 1) << 2).astype(np.uint8)
+    return (table[index >> 1] >> shift) & np.uint8(0xF)
+
+
+class PatternDatabase(abc.ABC):
+    """
+    A nibble-packed table of the distances of every state of a pattern,
+    usually memory-mapped from its file. Subclasses define the pattern.
+    """
+
+    SIZE = None
+    SOLVED_INDEX = None
+    FILE_NAME = None
+
+    def __init__(self, table):
+        assert len(table) == (self.SIZE + 1) // 2, "The table has the wrong size"
+        self.table = table
+
+    @staticmethod
+    @abc.abstractmethod
+    def index_of(coords):
+        """The states of the pattern of a batch of coordinates (cube_coords)."""
+
+    @staticmethod
+    @abc.abstractmethod
+    def move(index, moves):
+        """The states of the pattern after the given moves (broadcast with index)."""
+
+    @classmethod
+    def neighbors(cls, index):
+        """The len(index) x 18 states of the pattern reached by every move."""
+        return cls.move(np.asarray(index)[:, None], np.arange(18))
+
+    @classmethod
+    def build(cls, path=None, verbose=False):
+        """Compute the distances and save them to path, if given."""
+        dist = bfs_distances(cls.SIZE, cls.SOLVED_INDEX, cls.neighbors, verbose=verbose)
+        pdb = cls(pack_nibbles(dist))
+        if path is not None:
+            pdb.save(path)
+        return pdb
+
+    @classmethod
+    def open(cls, path):
+        return cls(cube_keys.map_bytes(path)[0])
+
+    @classmethod
+    def open_or_build(cls, path, verbose=False):
+        if os.path.exists(path):
+            return cls.open(path)
+        cls.build(path, verbose)
+        return cls.open(path)
+
+    def save(self, path):
+        np.asarray(self.table).tofile(path + ".tmp")
+        os.replace(path + ".tmp", path)
+
+    def __len__(self):
+        return self.SIZE
+
+    def __getitem__(self, index):
+        """Distances of the given states of the pattern (vectorized)."""
+        return unpack_nibbles(self.table, index)
+
+    def distance(self, coords):
+        """Lower bounds of the distances of a batch of coordinates from solved."""
+        return self[self.index_of(coords)]
+
+    def histogram(self):
+        """Number of states at every distance."""
+        counts = np.bincount(self.table & 0xF, minlength=16) + np.bincount(self.table >> 4, minlength=16)
+        if self.SIZE % 2:
+            counts[UNKNOWN] -= 1
+        return counts
+
+
+class CornerDatabase(PatternDatabase):
+    """The distances of the corners, cp * 2187 + co."""
+
+    SIZE = cube_coords.COORD_SIZES["cp"] * cube_coords.COORD_SIZES["co"]
+    SOLVED_INDEX = int(cube_coords.SOLVED_COORDS["cp"]) * 2187 + int(cube_coords.SOLVED_COORDS["co"])
+    FILE_NAME = "corners.pdb"
+
+    @staticmethod
+    def index_of(coords):
+        return coords["cp"].astype(np.int64) * 2187 + coords["co"]
+
+    @staticmethod
+    def move(index, moves):
+        cp, co = np.divmod(index, 2187)
+        cp_table = cube_coords.move_table("cp")
+        co_table = cube_coords.move_table("co")
+        return cp_table[cp, moves].astype(np.int64) * 2187 + co_table[co, moves]
+
+
+@functools.lru_cache(maxsize=None)
+def _edge_move_table():
+    # _edge_move_table()[ep, m] = ep' * 64 + flipped, where ep' is the ep_a
+    # (or ep_b) value ep after move m and flipped has the bits of the six
+    # edges that the move flips, the first edge in the high bit. An edge
+    # state then moves with one lookup and one xor.
+    ep_table = cube_coords.move_table("ep_a")
+    positions = cube_coords.edge_positions(np.arange(cube_coords.COORD_SIZES["ep_a"]))
+    weights = 1 << np.arange(5, -1, -1)
+    flips = cube_coords.MOVE_CUBIES[3]
+
+    table = np.empty(ep_table.shape, dtype=np.int32)
+    for m in range(18):
+        table[:, m] = ep_table[:, m] * 64 + flips[m][positions[ep_table[:, m]]] @ weights
+    table.flags.writeable = False
+    return table
+
+
+class EdgeDatabase(PatternDatabase):
+    """
+    The distances of six edges, ep * 64 + their flips, where ep is the ep_a
+    or ep_b coordinate and the flips have one bit per edge, the first edge in
+    the high bit. ep_a and ep_b share the move table, so only the edges and
+    thereby the solved state differ between the two databases.
+    """
+
+    SIZE = cube_coords.COORD_SIZES["ep_a"] * 64
+    FIELD = None
+
+    @classmethod
+    def index_of(cls, coords):
+        positions = cube_coords.edge_positions(coords[cls.FIELD])
+        eo = cube_coords.decode(coords)[3].astype(np.int64)
+        flips = np.take_along_axis(eo, positions, axis=1) @ (1 << np.arange(5, -1, -1))
+        return coords[cls.FIELD].astype(np.int64) * 64 + flips
+
+    @staticmethod
+    def move(index, moves):
+        return _edge_move_table()[index >> 6, moves] ^ (index & 63)
+
+
+class EdgeDatabaseA(EdgeDatabase):
+    """The distances of the edges UR UF UL UB DR DF."""
+
+    FIELD = "ep_a"
+    SOLVED_INDEX = int(cube_coords.SOLVED_COORDS["ep_a"]) * 64
+    FILE_NAME = "edges_a.pdb"
+
+
+class EdgeDatabaseB(EdgeDatabase):
+    """The distances of the edges DL DB FR FL BL BR."""
+
+    FIELD = "ep_b"
+    SOLVED_INDEX = int(cube_coords.SOLVED_COORDS["ep_b"]) * 64
+    FILE_NAME = "edges_b.pdb"
+
+
+DATABASES = [CornerDatabase, EdgeDatabaseA, EdgeDatabaseB]
+
+
+def prepare_move_tables():
+    """
+    Build the move tables of the databases, which are otherwise built on
+    the first move and would be counted as search time (the edge one takes
+    seconds).
+    """
+    cube_coords.move_table("cp")
+    cube_coords.move_table("co")
+    _edge_move_table()
+
+
+def open_databases(directory=".", verbose=False):
+    """Open all pattern databases in a directory, building the missing ones."""
+    databases = [cls.open_or_build(os.path.join(directory, cls.FILE_NAME), verbose) for cls in DATABASES]
+    prepare_move_tables()
+    return databases
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build or inspect the pattern databases.")
+    parser.add_argument("directory", nargs="?", default=".")
+    args = parser.parse_args()
+
+    for cls in DATABASES:
+        path = os.path.join(args.directory, cls.FILE_NAME)
+        start_time = time.time()
+        if not os.path.exists(path):
+            cls.build(path, verbose=True)
+            print(f"built {path} in {time.time() - start_time:.2f} s")
+
+        start_time = time.time()
+        pdb = cls.open(path)
+        print(f"opened {path} in {1000 * (time.time() - start_time):.2f} ms")
+        for depth, count in enumerate(pdb.histogram()):
+            if count:
+                print(f"depth {depth:2d}: {count:>12,d}")
@@ -9,13 +9,10 @@ from manim_rubikscube import *
 # This also replaces the default colors
 from solarized import *
 
+import cube_ball
+import cube_engine
 import util
 
-try:
-    from tqdm import trange
-except ImportError:
-    trange = range
-
 
 
 class Neighborhood(util.RubikScene):
@@ -27,72 +24,57 @@ class Neighborhood(util.RubikScene):
         """
         self.next_section("First layer", skip_animations=False)
 
-        edges = set()
-        q = [RubiksCube(cubie_size=0.2)]
-        seen = set([q[0].hash()])
-        layers = [[q[0].hash()], []]
-        parents = {}
-        parents[q[0].hash()] = None
-
-        print("Starting BFS")
-        for i in trange(262):  # 1, 19, 262
-            old_hash = q[i].hash()
-
-            for move in util.POSSIBLE_MOVES:
-                if i < 19:
-                    q[i].do_move(move)
-                else:
-                    # This is faster, but does not rotate visually
-                    q[i].update_indices_after_move(move)
-
-                new_hash = q[i].hash()
-                edges.add((min(old_hash, new_hash), max(old_hash, new_hash)))
-
-                if new_hash not in parents:
-                    parents[new_hash] = old_hash
+        graph = cube_ball.load_ball(3)
+        layers = graph.layers()
 
-                if new_hash not in seen:
-                    # We won't be showing these anyways, avoid copying
-                    if i < 19:
-                        q.append(q[i].copy())
-
-                    seen.add(new_hash)
-                    layers[-1].append(new_hash)
-
-                if i < 19:
-                    q[i].do_move(util.invert_move(move))
-                else:
-                    q[i].update_indices_after_move(util.invert_move(move))
-
-            if old_hash == layers[-2][-1]:
-                layers.append([])
+        # Cubes up to distance 2, each one move from its parent
+        q = [RubiksCube(cubie_size=0.2)]
+        for v in range(1, layers[2].stop):
+            cube = q[graph.parent[v]].copy()
+            cube.do_move(cube_engine.MOVE_NAMES[graph.parent_move[v]])
+            q.append(cube)
+
+        # The order in which a BFS trying the moves of util.POSSIBLE_MOVES
+        # finds the nodes, and its parents, so that the turns of one face
+        # are spread around the circles.
+        move_order = [cube_engine.move_index(move) for move in util.POSSIBLE_MOVES]
+        order = [[layers[0][0]]]
+        parent = {layers[0][0]: None}
+        for d in range(1, 3):
+            order.append([])
+            for u in order[d - 1]:
+                neighbors, moves = graph.neighbors(u)
+                by_move = dict(zip(moves.tolist(), neighbors.tolist()))
+                for m in move_order:
+                    v = by_move.get(m)
+                    if v is not None and v in layers[d] and v not in parent:
+                        parent[v] = u
+                        order[d].append(v)
 
         layout = {layers[0][0]: ORIGIN}
 
-        for li, layer in enumerate(layers[1:]):
+        for li, layer in enumerate(order[1:]):
             for i, h in enumerate(layer):
                 distance = (li + 1) * 3
                 pos = distance * UP * np.sin(2 * PI * i / len(layer))
                 pos += distance * RIGHT * np.cos(2 * PI * i / len(layer))
                 layout[h] = pos
 
-        print(f"Done with BFS, {len(seen)} vertices")
-
         self.add(q[0])
         self.wait()
-        return
 
         anims = []
         cubes1 = []
-        for i, move in enumerate(util.POSSIBLE_MOVES):
+        for i, v in enumerate(order[1]):
+            move = cube_engine.MOVE_NAMES[graph.parent_move[v]]
             cur_cube = q[0].copy()
             cubes1.append(cur_cube)
             anims.append(
                 AnimationGroup(
                     # Add 10 * OUT to keep the cubes in front of the edges
-                    CubeMove(cur_cube, move, layout[layers[1][i]] + 10 * OUT),
+                    CubeMove(cur_cube, move, layout[v] + 10 * OUT),
                     Create(
-                        Line(ORIGIN, layout[layers[1][i]], shade_in_3d=True, color=GRAY)
+                        Line(ORIGIN, layout[v], shade_in_3d=True, color=GRAY)
                     ),
                     run_time=0.5
                 )
@@ -101,6 +83,7 @@ class Neighborhood(util.RubikScene):
 
         self.play(LaggedStart(*anims, lag_ratio=0.2), q[0].animate.shift(10 * OUT))
         anims = []
+        edges = graph.edge_list().tolist()
 
         for u, v in edges:
             if u in layers[1] and v in layers[1]:
@@ -130,7 +113,7 @@ class Neighborhood(util.RubikScene):
                         u, v = v, u
 
                     # Skip the edge to the parent because we've already created it
-                    if u != parents[v]:
+                    if u != parent[v]:
                         anims.append(
                             Create(
                                 Line(
@@ -145,16 +128,16 @@ class Neighborhood(util.RubikScene):
                         )
 
 
-        for i, cube in enumerate(q[19:]):
-            h = cube.hash()
+        for i, h in enumerate(order[2]):
+            cube = q[h]
             # anims.append(
             #     Create(Dot(layout[h], color=GRAY))
             # )
 
-            def f(cube):
-                return cube.move_to(layout[cube.hash()]).set_stroke_width(0).scale(0.2)
+            def f(cube, h=h):
+                return cube.move_to(layout[h]).set_stroke_width(0).scale(0.2)
 
-            cube.move_to(layout[parents[h]])
+            cube.move_to(layout[parent[h]])
             cube.shift(IN * 10)
             self.add(cube)
             # self.bring_to_back(cube)
@@ -164,7 +147,7 @@ class Neighborhood(util.RubikScene):
                     ApplyFunction(f, cube),
                     Create(
                         Line(
-                            layout[parents[h]],
+                            layout[parent[h]],
                             layout[h],
                             shade_in_3d=True,
                             color=GRAY,
@@ -0,0 +1,187 @@
+"""
+Uniformly random cube states and estimates of how far from solved they are.
+
+Scrambles of random moves, like cube_engine.FELIKS_SCRAMBLE, do not reach
+all states with the same probability. A uniformly random state is drawn
+directly on the cubies (see cube_coords): random corner and edge
+permutations with the same parity, random twists of the corners that sum
+to 0 mod 3 and random flips of the edges that sum to 0 mod 2. Every such
+combination is a state of the cube, and every state comes out with
+probability 1 / STATE_COUNT.
+
+distance_histograms() measures batches of random states in worker processes
+and yields the histogram of their distances as the batches come in, so an
+estimate can be watched while it converges. The distance is one of:
+
+    optimal      exact, IDA* with the pattern databases (see cube_ida), slow
+    two_phase    the length of the cube_twophase solution, an upper bound
+    lower_bound  the largest pattern database distance, a lower bound
+
+Only "optimal" gives the histogram of the distances of the cube. The other
+two bound it from either side: the two_phase histogram is that of the
+solver's first solution (no time_limit, so that a seed always gives the
+same histogram), about 21 moves on average, where the optimal distance of
+a random cube is about 18.
+
+    python cube_sampling.py 1000 --distance two_phase --processes 8
+"""
+import argparse
+import functools
+import math
+import multiprocessing
+import time
+
+import numpy as np
+
+import cube_coords
+import cube_ida
+import cube_pdb
+import cube_twophase
+
+# 8! * 3^7 * 12! * 2^11 / 2, the parity of the corners and edges is the same.
+STATE_COUNT = 43252003274489856000
+
+# Distances 0..31, more than any of the measures below can return.
+HISTOGRAM_SIZE = 32
+
+
+def uniform_cubies(n, rng=None):
+    """Cubie arrays (cp, co, ep, eo) of n uniformly random states."""
+    rng = np.random.default_rng(rng)
+    cp = rng.permuted(np.tile(np.arange(8, dtype=np.int8), (n, 1)), axis=1)
+    ep = rng.permuted(np.tile(np.arange(12, dtype=np.int8), (n, 1)), axis=1)
+    # Swapping two edges pairs up edge permutations of either parity, so
+    # doing it where the parities differ keeps the distribution uniform.
+    odd = np.flatnonzero(cube_coords.permutation_parity(cp) != cube_coords.permutation_parity(ep))
+    ep[odd, 10], ep[odd, 11] = ep[odd, 11], ep[odd, 10]
+
+    co = rng.integers(0, 3, size=(n, 8), dtype=np.int8)
+    co[:, 7] = -co[:, :7].sum(axis=1) % 3
+    eo = rng.integers(0, 2, size=(n, 12), dtype=np.int8)
+    eo[:, 11] = eo[:, :11].sum(axis=1) % 2
+    return cp, co, ep, eo
+
+
+def uniform_states(n, rng=None):
+    """An n x 48 batch of uniformly random states."""
+    return cube_coords.cubies_to_stickers(uniform_cubies(n, rng))
+
+
+@functools.lru_cache(maxsize=None)
+def _databases(pdb_dir):
+    # Opened once per process, the mappings are shared through the page cache.
+    return cube_pdb.open_databases(pdb_dir)
+
+
+def optimal_distances(states, pdb_dir="."):
+    databases = _databases(pdb_dir)
+    return np.array([len(cube_ida.solve(state, databases)) for state in states])
+
+
+def two_phase_lengths(states, pdb_dir=None):
+    # The first solution, a search for a shorter one until a time limit
+    # would depend on the speed and load of the machine.
+    solutions = [cube_twophase.solve(state, time_limit=0) for state in states]
+    assert all(solution is not None for solution in solutions), "No two-phase solution"
+    return np.array([len(solution) for solution in solutions])
+
+
+def lower_bounds(states, pdb_dir="."):
+    databases = _databases(pdb_dir)
+    coords = cube_coords.from_stickers(states)
+    return cube_ida.lower_bound([db.index_of(coords) for db in databases], databases)
+
+
+DISTANCES = {
+    "optimal": optimal_distances,
+    "two_phase": two_phase_lengths,
+    "lower_bound": lower_bounds,
+}
+
+
+def _sample_task(args):
+    # The histogram of the distances of one batch of random states.
+    seed, size, distance, pdb_dir = args
+    distances = DISTANCES[distance](uniform_states(size, np.random.default_rng(seed)), pdb_dir)
+    return np.bincount(distances, minlength=HISTOGRAM_SIZE)
+
+
+def distance_histograms(
+    samples, distance="two_phase", processes=1, batch_size=16, seed=None, pdb_dir="."
+):
+    """
+    Measure `samples` uniformly random states in batches, yielding the
+    counts of the states by distance (HISTOGRAM_SIZE of them) so far after
+    every batch. The batches have their own seeds derived from `seed`, so the
+    final histogram does not depend on the number of processes.
+    """
+    seeds = np.random.SeedSequence(seed).spawn(math.ceil(samples / batch_size))
+    tasks = [
+        (child, min(batch_size, samples - i * batch_size), distance, pdb_dir)
+        for i, child in enumerate(seeds)
+    ]
+    counts = np.zeros(HISTOGRAM_SIZE, dtype=np.int64)
+
+    pool = multiprocessing.get_context("fork").Pool(processes) if processes > 1 else None
+    try:
+        results = pool.imap_unordered(_sample_task, tasks) if pool else map(_sample_task, tasks)
+        for part in results:
+            counts += part
+            yield counts.copy()
+    finally:
+        if pool:
+            pool.terminate()
+            pool.join()
+
+
+def summarize(counts):
+    """
+    The fraction of the samples at every distance and its standard error,
+    and the mean distance and its standard error.
+    """
+    n = counts.sum()
+    fractions = counts / n
+    errors = np.sqrt(fractions * (1 - fractions) / n)
+    distances = np.arange(len(counts))
+    mean = (distances * fractions).sum()
+    mean_error = np.sqrt(((distances - mean) ** 2 * fractions).sum() / n)
+    return fractions, errors, mean, mean_error
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Estimate the distribution of distances from solved of random states."
+    )
+    parser.add_argument("samples", type=int)
+    parser.add_argument("--distance", choices=list(DISTANCES), default="two_phase")
+    parser.add_argument("--processes", type=int, default=1)
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--pdb-dir", default=".", help="pattern databases, built if missing")
+    args = parser.parse_args()
+
+    if args.distance != "two_phase":
+        # Built here once rather than in every worker.
+        _databases(args.pdb_dir)
+
+    start_time = time.time()
+    last_report = start_time
+    for counts in distance_histograms(
+        args.samples, args.distance, args.processes, args.batch_size, args.seed, args.pdb_dir
+    ):
+        now = time.time()
+        if now - last_report > 1 or counts.sum() == args.samples:
+            _, _, mean, mean_error = summarize(counts)
+            print(
+                f"{counts.sum():>8,d} samples, mean {mean:6.3f} +- {mean_error:.3f}, "
+                f"{counts.sum() / (now - start_time):8.1f} samples/s"
+            )
+            last_report = now
+
+    fractions, errors, _, _ = summarize(counts)
+    for depth in np.flatnonzero(counts):
+        print(
+            f"depth {depth:2d}: {counts[depth]:>8,d} samples, "
+            f"{fractions[depth]:.4f} +- {errors[depth]:.4f}, "
+            f"~{fractions[depth] * STATE_COUNT:.2e} states"
+        )
@@ -0,0 +1,259 @@
+"""
+Canonical move sequences, the ones explore_states in code/*.cpp walks through.
+
+A sequence is canonical if no face is turned twice in a row and two opposite
+faces turned one after another always come in increasing order, i.e. the
+C++ skips `face == last_face || (face < last_face && face + last_face == 5)`.
+Every position reachable in n moves is reached by a canonical sequence of
+length at most n, and there are far fewer of them than 18^n.
+
+Sequences are ordered like the C++ search visits them, which is the
+lexicographic order of their move indices (see cube_engine.MOVE_NAMES).
+rank() and unrank() translate between a sequence and its number in that
+order, so a search over all sequences of length n can be cut into slices of
+equal size and any slice can be started without replaying what comes before.
+
+compile_sequence() turns any move sequence, canonical or not, into one
+permutation of the cells, so that applying it to a batch is one gather
+whatever its length. Compiled sequences are kept in an LRU cache keyed by
+their move string, so replaying the same scrambles and solutions is free.
+"""
+import functools
+
+import numpy as np
+
+import cube_coords
+import cube_engine
+
+# Number of compiled sequences kept by compile_sequence(), 48 bytes each,
+# and of those whose coordinate tables (about 6 MB) are kept.
+COMPILE_CACHE_SIZE = 4096
+COORD_TABLE_CACHE_SIZE = 16
+
+
+def is_allowed(last_face, face):
+    """Can `face` be turned after `last_face` (-1 for the first move)?"""
+    return not (face == last_face or (face < last_face and face + last_face == 5))
+
+
+# ALLOWED[last_face + 1, face], the first row is for the first move.
+ALLOWED = np.array([[is_allowed(last, face) for face in range(6)] for last in range(-1, 6)])
+
+
+@functools.lru_cache(maxsize=None)
+def _counts(n):
+    # _counts(n)[last_face + 1] = number of canonical continuations of length n.
+    if n == 0:
+        return (1,) * 7
+    prev = _counts(n - 1)
+    return tuple(
+        sum(3 * prev[face + 1] for face in range(6) if ALLOWED[last + 1, face])
+        for last in range(-1, 6)
+    )
+
+
+def count(n, last_face=-1):
+    """Exact number of canonical sequences of length n."""
+    return _counts(n)[last_face + 1]
+
+
+def rank(moves):
+    """The number of a canonical sequence among those of the same length."""
+    moves = [cube_engine.move_index(move) for move in moves]
+    res = 0
+    last = -1
+    for i, move in enumerate(moves):
+        face, turn = divmod(move, 3)
+        assert ALLOWED[last + 1, face], f"Not a canonical sequence: {moves}"
+        rest = _counts(len(moves) - i - 1)
+        res += sum(3 * rest[f + 1] for f in range(face) if ALLOWED[last + 1, f])
+        res += turn * rest[face + 1]
+        last = face
+    return res
+
+
+def unrank(k, n):
+    """The canonical sequence of length n with the number k, as move indices."""
+    assert 0 <= k < count(n), f"There are only {count(n)} sequences of length {n}"
+    moves = []
+    last = -1
+    for i in range(n):
+        rest = _counts(n - i - 1)
+        for face in range(6):
+            if not ALLOWED[last + 1, face]:
+                continue
+            if k < 3 * rest[face + 1]:
+                turn, k = divmod(k, rest[face + 1])
+                moves.append(3 * face + turn)
+                last = face
+                break
+            k -= 3 * rest[face + 1]
+    return moves
+
+
+def unrank_many(ks, n):
+    """Vectorized unrank, returns an len(ks) x n int8 array of move indices."""
+    assert count(n) < 2 ** 63, "Too many sequences for int64 ranks"
+    ks = np.array(ks, dtype=np.int64)
+    res = np.empty((len(ks), n), dtype=np.int8)
+    last = np.full(len(ks), -1)
+
+    for i in range(n):
+        rest = np.array(_counts(n - i - 1)[1:], dtype=np.int64)
+        sizes = np.where(ALLOWED[last + 1], 3 * rest, 0)
+        ends = np.cumsum(sizes, axis=1)
+        face = (ends <= ks[:, None]).sum(axis=1)
+        ks -= ends[np.arange(len(ks)), face] - sizes[np.arange(len(ks)), face]
+        turn, ks = np.divmod(ks, rest[face])
+        res[:, i] = 3 * face + turn
+        last = face
+
+    return res
+
+
+def sequences(n, start=0, stop=None, batch_size=1 << 16):
+    """
+    Yield the canonical sequences of length n with numbers start..stop - 1 in
+    order, as batches of at most batch_size rows of move indices.
+    """
+    stop = count(n) if stop is None else min(stop, count(n))
+    for batch_start in range(start, stop, batch_size):
+        yield unrank_many(np.arange(batch_start, min(batch_start + batch_size, stop)), n)
+
+
+def partition(n, parts):
+    """Split the sequences of length n into `parts` contiguous (start, stop) slices."""
+    total = count(n)
+    bounds = [total * i // parts for i in range(parts + 1)]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def apply_sequences(state, moves):
+    """
+    The states reached from `state` (one 48 cell state or one per row) by
+    each row of an N x n array of move indices.
+    """
+    moves = np.asarray(moves).reshape(len(moves), -1)
+    states = np.broadcast_to(state, (len(moves), 48))
+    for i in range(moves.shape[1]):
+        states = np.take_along_axis(states, cube_engine.MOVE_PERMS[moves[:, i]], axis=1)
+    return np.array(states, dtype=np.uint8)
+
+
+def move_string(moves):
+    """The canonical string of a sequence of moves (names, indices or "R U R'")."""
+    if isinstance(moves, str):
+        moves = moves.split()
+    return " ".join(cube_engine.MOVE_NAMES[cube_engine.move_index(move)] for move in moves)
+
+
+def simplify(moves):
+    """
+    The shortest canonical sequence that the moves (names, indices or a
+    string) reduce to by cancelling and merging turns of the same face, with
+    commuting turns of opposite faces brought together and in increasing
+    order, e.g. "R L R'" becomes "L".
+
+    Returns the move names and, for each of them, the indices of the
+    original moves merged into it. Original moves in none of them cancel
+    out, so a scene can skip them and still number the moves as before.
+    """
+    if isinstance(moves, str):
+        moves = moves.split()
+    # Runs of moves on one axis, as [axis, {face: [quarter turns, indices]}],
+    # no two consecutive runs on the same axis.
+    runs = []
+    for i, move in enumerate(moves):
+        face, turns = divmod(cube_engine.move_index(move), 3)
+        axis = min(face, 5 - face)
+        if not runs or runs[-1][0] != axis:
+            runs.append([axis, {}])
+        quarters, indices = runs[-1][1].setdefault(face, [0, []])
+        runs[-1][1][face] = [(quarters + turns + 1) % 4, indices + [i]]
+        if all(quarters == 0 for quarters, _ in runs[-1][1].values()):
+            # The run cancels out, so the previous one may go on.
+            runs.pop()
+
+    res = []
+    origins = []
+    for _, faces in runs:
+        for face in sorted(faces):
+            quarters, indices = faces[face]
+            if quarters:
+                res.append(cube_engine.MOVE_NAMES[3 * face + quarters - 1])
+                origins.append(indices)
+    return res, origins
+
+
+class CompiledSequence:
+    """
+    A move sequence composed into one gather permutation of the cells, see
+    compile_sequence(). Its cubie arrays and coordinate tables do the same
+    for cube_coords representations.
+    """
+
+    def __init__(self, key):
+        self.key = key
+        self.moves = [cube_engine.move_index(move) for move in key.split()]
+        self.perm = cube_engine.compose(*[cube_engine.MOVE_PERMS[m] for m in self.moves])
+        self.perm.flags.writeable = False
+
+    def __len__(self):
+        return len(self.moves)
+
+    def __repr__(self):
+        return f"CompiledSequence({self.key!r})"
+
+    def apply(self, states):
+        """The states after the sequence, one gather for a state or a batch."""
+        return np.asarray(states)[..., self.perm]
+
+    @functools.cached_property
+    def cubies(self):
+        """Cubie arrays of the sequence, to be used with cube_coords.multiply."""
+        return cube_coords.stickers_to_cubies(cube_engine.SOLVED[self.perm])
+
+    def coord_tables(self):
+        """
+        For every coordinate, its values after the sequence indexed by its
+        values before (like a column of cube_coords.move_table).
+        """
+        return _coord_tables(self.key)
+
+    def apply_coords(self, coords):
+        """The coordinates after the sequence, one lookup per coordinate."""
+        coords = np.asarray(coords, dtype=cube_coords.COORD_DTYPE)
+        res = np.empty_like(coords)
+        for name, table in self.coord_tables().items():
+            res[name] = table[coords[name]]
+        return res
+
+
+@functools.lru_cache(maxsize=COORD_TABLE_CACHE_SIZE)
+def _coord_tables(key):
+    tables = {}
+    for name in cube_coords.COORD_DTYPE.names:
+        move_table = cube_coords.move_table(name)
+        table = np.arange(len(move_table), dtype=move_table.dtype)
+        for move in compile_sequence(key).moves:
+            table = move_table[table, move]
+        table.flags.writeable = False
+        tables[name] = table
+    return tables
+
+
+@functools.lru_cache(maxsize=COMPILE_CACHE_SIZE)
+def _compile(key):
+    return CompiledSequence(key)
+
+
+def compile_sequence(moves):
+    """
+    The CompiledSequence of a sequence of moves (names, indices or a string
+    like "R U R'"), from the cache if it was compiled recently.
+    """
+    return _compile(move_string(moves))
+
+
+def compile_cache_info():
+    return _compile.cache_info()
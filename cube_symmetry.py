@@ -0,0 +1,174 @@
+"""
+The 48 symmetries of the cube (24 rotations, each with and without a
+mirror) and canonical representatives of states under them.
+
+A symmetry is a signed permutation matrix acting on the cells, placed in
+space with x to the right, y up and z to the front, each cell at 2 * (the
+position of its cubie) + (the normal of its face). Conjugating a state by a
+symmetry moves every color to the cell it is mapped to and then renames
+the colors so that the centers are back in place. This changes neither the
+distance from solved, nor does taking the inverse of the state.
+
+So a table of distances from solved only needs one state out of the up to
+96 that are conjugates of a state or of its inverse: the one with the
+smallest packed key (see cube_keys), which canonical_keys() computes for a
+whole batch. class_sizes() gives the number of states a representative
+stands for, so that counts of states can still be recovered.
+"""
+import itertools
+
+import numpy as np
+
+import cube_coords
+import cube_engine
+import cube_keys
+
+# Normals of the faces, in the order of cube_engine.FACES.
+FACE_NORMALS = np.array(
+    [[0, 0, 1], [-1, 0, 0], [0, 1, 0], [0, -1, 0], [1, 0, 0], [0, 0, -1]]
+)
+
+
+def _cell_points():
+    # Cells of every face by row and column of the layout in cube_engine,
+    # and the position of their cubie as a function of the row and column.
+    faces = {
+        "F": ([[11, 12, 13], [22, -1, 23], [31, 32, 33]], lambda r, c: (c - 1, 1 - r, 1)),
+        "L": ([[8, 9, 10], [20, -1, 21], [28, 29, 30]], lambda r, c: (-1, 1 - r, c - 1)),
+        "U": ([[0, 1, 2], [3, -1, 4], [5, 6, 7]], lambda r, c: (c - 1, 1, r - 1)),
+        "D": ([[40, 41, 42], [43, -1, 44], [45, 46, 47]], lambda r, c: (c - 1, -1, 1 - r)),
+        "R": ([[14, 15, 16], [24, -1, 25], [34, 35, 36]], lambda r, c: (1, 1 - r, 1 - c)),
+        "B": ([[17, 18, 19], [26, -1, 27], [37, 38, 39]], lambda r, c: (1 - c, 1 - r, -1)),
+    }
+    points = np.empty((48, 3), dtype=np.int64)
+    for face, (cells, position) in faces.items():
+        normal = FACE_NORMALS[cube_engine.FACES.index(face)]
+        for r, c in itertools.product(range(3), range(3)):
+            if cells[r][c] >= 0:
+                points[cells[r][c]] = 2 * np.array(position(r, c)) + normal
+    return points
+
+
+def _symmetries():
+    points = _cell_points()
+    point_index = {tuple(p): i for i, p in enumerate(points)}
+    normal_index = {tuple(n): f for f, n in enumerate(FACE_NORMALS)}
+
+    matrices = []
+    for axes in itertools.permutations(range(3)):
+        for signs in itertools.product([1, -1], repeat=3):
+            matrix = np.zeros((3, 3), dtype=np.int64)
+            matrix[range(3), axes] = signs
+            matrices.append(matrix)
+    # The identity first, then the rotations, then the mirrored ones.
+    matrices.sort(key=lambda m: (round(np.linalg.det(m)) < 0, not np.array_equal(m, np.eye(3))))
+
+    perms = np.empty((48, 48), dtype=np.int64)
+    colors = np.empty((48, 6), dtype=np.uint8)
+    for s, matrix in enumerate(matrices):
+        moved = points @ matrix.T
+        # The cell j that cell i goes to takes its color: a gather from i.
+        for i, point in enumerate(moved):
+            perms[s, point_index[tuple(point)]] = i
+        for f, normal in enumerate(FACE_NORMALS @ matrix.T):
+            colors[s, f] = normal_index[tuple(normal)]
+    return np.array(matrices), perms, colors
+
+
+# MATRICES[s] maps the cells, SYMMETRY_PERMS[s] is the matching gather and
+# SYMMETRY_COLORS[s][c] the new name of color c.
+MATRICES, SYMMETRY_PERMS, SYMMETRY_COLORS = _symmetries()
+ROTATIONS = np.flatnonzero(np.round(np.linalg.det(MATRICES)) > 0)
+
+
+# For looking up SYMMETRY_COLORS[s][c] as _FLAT_COLORS[6 * s + c].
+_FLAT_COLORS = SYMMETRY_COLORS.ravel()
+_COLOR_OFFSETS = (6 * np.arange(48, dtype=np.uint16))[:, None]
+
+
+def conjugates(states, cells=slice(None)):
+    """All 48 conjugates of a batch of states, N x 48 x 48 (or only some cells)."""
+    states = np.asarray(states, dtype=np.uint8).reshape(-1, 48)
+    index = states[:, SYMMETRY_PERMS[:, cells]].astype(np.uint16)
+    return _FLAT_COLORS[index + _COLOR_OFFSETS]
+
+
+def _conjugate(states, symmetries, cells):
+    # The given cells of the conjugate of every state by one symmetry each.
+    index = np.take_along_axis(states, SYMMETRY_PERMS[symmetries][:, cells], axis=1)
+    return _FLAT_COLORS[index.astype(np.uint16) + _COLOR_OFFSETS[symmetries]]
+
+
+def inverse(states):
+    """The inverses of a batch of states."""
+    cubies = cube_coords.stickers_to_cubies(states)
+    return cube_coords.cubies_to_stickers(cube_coords.invert(cubies))
+
+
+def _sources(states, with_inverse):
+    # The states whose conjugates are considered, N x (1 or 2) x 48.
+    states = np.asarray(states, dtype=np.uint8).reshape(-1, 48)
+    if with_inverse:
+        return np.stack([states, inverse(states)], axis=1)
+    return states[:, None]
+
+
+# Base-6 place values of 8 cells, in float32 so that numpy uses BLAS (exact,
+# since 6 ** 8 < 2 ** 24).
+_DIGIT_WEIGHTS = (6.0 ** np.arange(7, -1, -1)).astype(np.float32)
+
+
+def _digits_value(cells):
+    return (cells @ _DIGIT_WEIGHTS).astype(np.uint64)
+
+
+def canonical_keys(states, with_inverse=True, batch_size=1 << 12):
+    """
+    The smallest packed key among the conjugates of every state (and of its
+    inverse), the same for all states that are symmetric to each other.
+
+    The minimum is taken 8 cells at a time: the first 8 cells of all 96 (or
+    48) conjugates, the next 8 only of those that are still tied for the
+    smallest, and so on. Usually only one conjugate is left after the first
+    step. The states are done batch_size at a time.
+    """
+    states = np.asarray(states, dtype=np.uint8).reshape(-1, 48)
+    res = np.empty(len(states), dtype=cube_keys.KEY_DTYPE)
+
+    for start in range(0, len(states), batch_size):
+        sources = _sources(states[start:start + batch_size], with_inverse)
+        n, k = sources.shape[:2]
+
+        values = _digits_value(conjugates(sources.reshape(-1, 48), slice(0, 8))).reshape(n, k * 48)
+        key = values.min(axis=1)
+        rows, cols = np.nonzero(values == key[:, None])
+        for begin in range(8, 48, 8):
+            values = _digits_value(_conjugate(sources[rows, cols // 48], cols % 48, slice(begin, begin + 8)))
+            smallest = np.full(n, np.iinfo(np.uint64).max, dtype=np.uint64)
+            np.minimum.at(smallest, rows, values)
+            tied = values == smallest[rows]
+            rows, cols = rows[tied], cols[tied]
+            key = key * np.uint64(6 ** 8) + smallest
+            if begin == 16:
+                res["hi"][start:start + n] = key
+                key = np.zeros(n, dtype=np.uint64)
+        res["lo"][start:start + n] = key
+    return res
+
+
+def canonicalize(states, with_inverse=True):
+    """The representatives of a batch of states, as states."""
+    return cube_keys.unpack(canonical_keys(states, with_inverse))
+
+
+def class_sizes(keys, with_inverse=True):
+    """
+    The number of distinct states that each representative (key) stands
+    for: the 96 (or 48) maps form a group, so this is 96 divided by the
+    number of them that leave the representative as it is.
+    """
+    states = cube_keys.unpack(keys)
+    sources = _sources(states, with_inverse)
+    n, k = sources.shape[:2]
+    images = conjugates(sources.reshape(-1, 48)).reshape(n, k * 48, 48)
+    return k * 48 // (images == states[:, None]).all(axis=2).sum(axis=1)
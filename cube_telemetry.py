@@ -0,0 +1,154 @@
+"""
+Progress records of long searches, as JSON lines.
+
+The C++ programs print a line every 10^9 leaves. The Python searches
+(cube_bfs, cube_mitm, cube_ida and explore in cube_bitset) take a Telemetry
+instead, which appends one JSON object per line to a file:
+
+    {"event": "progress", "name": "bfs", "depth": 7, "expanded": 3407872,
+     "total": 7618438, "states_per_second": 1203311.5, "rss_bytes": 1893613568,
+     "eta_seconds": 48.3, "elapsed": 2.83, "time": 1729240000.0}
+
+A search is split into phases, one per depth (or length or bound). Every
+phase starts with a "begin" record and ends with an "end" record, and in
+between there is a "progress" record at most every `interval` seconds. The
+rate is that of the current phase. The searches add what they know, like
+"unique" (states found at the depth), "bytes_per_state" (RSS per stored
+state) or "fill" (of a bitset).
+
+Where the work of the phase is known, the ETA is the rest of it at the
+current rate, plus the later phases estimated with BRANCHING_FACTOR. With
+progress=True there is also a tqdm bar per phase, if tqdm is installed.
+
+    python cube_bfs.py 7 --telemetry bfs.jsonl --progress
+"""
+import json
+import os
+import sys
+import time
+
+import cube_sequences
+
+try:
+    from tqdm import tqdm
+except ImportError:
+    tqdm = None
+
+# The growth of the number of canonical sequences from one length to the
+# next, about 13.35: each depth of a search does this much more work.
+BRANCHING_FACTOR = cube_sequences.count(21) / cube_sequences.count(20)
+
+
+def later_work(size, phases):
+    """The estimated work of `phases` more phases after one of the given size."""
+    return sum(size * BRANCHING_FACTOR ** k for k in range(1, phases + 1))
+
+
+def rss_bytes():
+    """
+    The resident memory of this process (its peak where /proc is missing),
+    None on Windows, which has neither /proc nor the resource module.
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class Telemetry:
+    """
+    Writes the records of a search to `path` ("-" for stdout, None for no
+    file, only the bar with progress=True).
+    """
+
+    def __init__(self, path=None, interval=10.0, progress=False):
+        self.file = sys.stdout if path == "-" else open(path, "a") if path else None
+        self.interval = interval
+        self.bar = None
+        self.progress = progress and tqdm is not None
+        self.start_time = time.time()
+        self.name = None
+        self.depth = None
+        self.total = None
+        self.later = 0
+        self.done = 0
+        self.phase_start = self.start_time
+        self.last_record = self.start_time
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def record(self, event, **fields):
+        """Write one record with the given fields and the time and memory."""
+        now = time.time()
+        res = {"event": event, "name": self.name, "depth": self.depth, **fields}
+        res["rss_bytes"] = rss_bytes()
+        if "stored" in fields and res["rss_bytes"] is not None:
+            res["bytes_per_state"] = res["rss_bytes"] / max(fields["stored"], 1)
+        res["elapsed"] = now - self.start_time
+        res["time"] = now
+        if self.file:
+            self.file.write(json.dumps(res) + "\n")
+            self.file.flush()
+        self.last_record = now
+
+    def begin(self, name, depth, total=None, later=0, unit="states"):
+        """
+        Start a phase that will process `total` items (None if not known),
+        with about `later` items in the phases after it.
+        """
+        self.name = name
+        self.depth = depth
+        self.total = total
+        self.later = later
+        self.done = 0
+        self.phase_start = time.time()
+        self.record("begin", total=total)
+        if self.progress:
+            self.bar = tqdm(total=total, desc=f"{name} {depth}", unit=unit, unit_scale=True)
+
+    def due(self):
+        """Is a progress record due? Lets a search skip costly fields otherwise."""
+        return time.time() - self.last_record >= self.interval
+
+    def _rates(self):
+        elapsed = time.time() - self.phase_start
+        rate = self.done / max(elapsed, 1e-9)
+        fields = {"expanded": self.done, "total": self.total, "states_per_second": rate}
+        if self.total is not None and rate > 0:
+            fields["eta_seconds"] = (max(self.total - self.done, 0) + self.later) / rate
+        return fields
+
+    def update(self, done, **fields):
+        """Set the number of items done in the phase, and record it if due."""
+        if self.bar is not None:
+            self.bar.update(done - self.done)
+        self.done = done
+        if self.due():
+            self.record("progress", **self._rates(), **fields)
+
+    def end(self, done=None, **fields):
+        """End the phase, always with a record."""
+        if done is not None:
+            self.update(done)
+        if self.bar is not None:
+            self.bar.close()
+            self.bar = None
+        self.record("end", **self._rates(), **fields)
+
+    def close(self):
+        if self.bar is not None:
+            self.bar.close()
+        if self.file not in (None, sys.stdout):
+            self.file.close()
+        self.file = None
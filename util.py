@@ -6,6 +6,9 @@ from manim import *
 
 from manim_rubikscube import cube_utils
 
+import cube_engine
+import cube_sequences
+
 
 class RubikScene(ThreeDScene):
     def __init__(self, *args, **kwargs):
@@ -70,28 +73,8 @@ def bfs(adj, start):
     return res_vertices, res_edges
 
 
-# https://ruwix.com/blog/feliks-zemdegs-rubiks-world-record-2016-4-73/
 # TODO check (with our program?) this is indeed the best solution
-FELIKS_SCRAMBLE_MOVES = [
-    "U2",
-    "F",
-    "L2",
-    "U2",
-    "R2",
-    "F",
-    "L2",
-    "F2",
-    "L'",
-    "D'",
-    "B2",
-    "R",
-    "D2",
-    "R'",
-    "B'",
-    "U'",
-    "L'",
-    "B'",
-]
+FELIKS_SCRAMBLE_MOVES = cube_engine.FELIKS_SCRAMBLE.split()
 
 
 def invert_move(move):
@@ -178,6 +161,12 @@ FELIKS_ACTUAL_SOLUTION_MOVES = [
     apply_feliks_turn(move) for move in FELIKS_ACTUAL_SOLUTION_MOVES_RAW
 ]
 
+# The same solution without the moves that cancel out ("R", "R'" back to
+# back), and which of the moves above each of the remaining ones stands for.
+FELIKS_ACTUAL_SOLUTION_SIMPLIFIED, FELIKS_ACTUAL_SOLUTION_ORIGINS = cube_sequences.simplify(
+    FELIKS_ACTUAL_SOLUTION_MOVES
+)
+
 POSSIBLE_MOVES = [
     "U",
     "U'",